@@ -0,0 +1,62 @@
+"""
+Measures genome evaluation throughput for every activation function.
+
+Run from the repository root:
+    python -m benchmarks.bench_activation
+"""
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+import neat
+import neat_batch
+
+
+def make_population(count, mutations, activation, seed):
+    random.seed(seed)
+    return [neat.random_genome(mutations, node_mut_rate=0.1, con_mut_rate=0.2, activation=activation) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--population', type=int, default=50)
+    parser.add_argument('--mutations', type=int, default=100, help='mutations applied to each genome beforehand')
+    parser.add_argument('--ticks', type=int, default=100, help='evaluations of the whole population per run')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = np.random.default_rng(1).uniform(-2, 2, (args.ticks, args.population, 7))
+    rows = inputs.tolist()
+
+    print('{:<12} {:>14} {:>14} {:>14}'.format('activation', 'Genome.eval', 'compiled', 'batch'))
+    for name in neat.ACTIVATION_NAMES:
+        genomes = make_population(args.population, args.mutations, name, 2)
+        compiled = [g.compile() for g in genomes]
+        evaluator = neat_batch.PopulationEvaluator(genomes)
+
+        def run_genome():
+            for tick in rows:
+                for g, i in zip(genomes, tick):
+                    g.eval(i)
+
+        def run_compiled():
+            for tick in rows:
+                for c, i in zip(compiled, tick):
+                    c.eval(i)
+
+        def run_batch():
+            for tick in inputs:
+                evaluator.eval(tick)
+
+        evals = args.ticks * args.population
+        rates = []
+        for run in (run_genome, run_compiled, run_batch):
+            best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            rates.append(evals / best)
+        print('{:<12} {:>10.0f} e/s {:>10.0f} e/s {:>10.0f} e/s'.format(name, *rates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares copy.deepcopy of genomes with Genome.clone.
+
+Run from the repository root:
+    python -m benchmarks.bench_clone
+"""
+import argparse
+import copy
+import random
+import timeit
+
+import neat
+
+
+def make_parents(count, mutations, seed):
+    random.seed(seed)
+    return [neat.random_genome(mutations, node_mut_rate=0.1, con_mut_rate=0.2) for _ in range(count)]
+
+
+def spawn(parents, children, copy_genome):
+    """
+    Creates a generation the way spawn_and_reset does: every child is a copy
+    of a parent followed by one mutation
+    """
+    offspring = []
+    for i in range(children):
+        child = copy_genome(parents[i % len(parents)])
+        child.mutate()
+        offspring.append(child)
+    return offspring
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--children', type=int, default=5000, help='offspring per generation')
+    parser.add_argument('--mutations', type=int, default=200, help='mutations applied to each parent beforehand')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    parents = make_parents(4, args.mutations, 1)
+    print('Parent sizes: {}'.format(', '.join('{} nodes / {} connections'.format(len(p.nodes), len(p.connections)) for p in parents)))
+
+    variants = [
+        ('copy.deepcopy', copy.deepcopy),
+        ('clone', lambda g: g.clone()),
+        ('clone copy-on-write', lambda g: g.clone(copy_on_write=True)),
+    ]
+    baseline = None
+    for name, copy_genome in variants:
+        random.seed(2)
+        best = min(timeit.repeat(lambda: spawn(parents, args.children, copy_genome), number=1, repeat=args.repeat))
+        if baseline is None:
+            baseline = best
+        print('{:<22} {:8.1f} ms per generation of {} ({:.1f}x)'.format(name, best * 1000, args.children, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Measures end-to-end headless training throughput.
+
+Run from the repository root:
+    python -m benchmarks.bench_generation --population 50 500 5000
+
+Every population size trains from the same seed on the same terrain for
+--generations generations, as train_headless does. Reported are ticks and
+generations per second, the share of time spent evaluating genomes,
+updating ships, checking collisions and breeding, and peak memory.
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import main as lander
+import neat
+from math2d import Vec2d
+from physics import VectorPhysics
+
+PHASES = ['Genome.eval', 'Ship.update', 'Game.check_collisions', 'spawn_and_reset']
+
+
+def make_game(population, seed, vector_physics):
+    random.seed(seed)
+    np.random.seed(seed)
+    screen_size = Vec2d(1280, 720)
+    level = lander.Level.generate(screen_size.x, 2 * screen_size.y // 3, screen_size.y, 10)
+    game = lander.Game(level, [], screen_size, physics=VectorPhysics() if vector_physics else None)
+    for _ in range(population):
+        genome = neat.random_genome(1, node_mut_rate=0.1, con_mut_rate=0.2)
+        game.ships.append(lander.AiShip(screen_size / 2, 50, color=(20, 190, 250), genome=genome, with_fire=False))
+    game.reset_physics()
+    return game
+
+
+def run(population, generations, *, seed=1, dt=0.033, vector_physics=True, trace_memory=False):
+    game = make_game(population, seed, vector_physics)
+    screen_rect = lander.Rect(0, 0, 1280, 720)
+    phases = dict.fromkeys(PHASES, 0.0)
+
+    # Time the collision check on its own, it runs inside Game.update
+    check_collisions = game.check_collisions
+    def timed_check_collisions():
+        start = time.perf_counter()
+        check_collisions()
+        phases['Game.check_collisions'] += time.perf_counter() - start
+    game.check_collisions = timed_check_collisions
+
+    if trace_memory:
+        tracemalloc.start()
+    ticks = 0
+    start = time.perf_counter()
+    for _ in range(generations):
+        t = time.perf_counter()
+        evaluator = lander.build_evaluator(game.ships)
+        phases['Genome.eval'] += time.perf_counter() - t
+        while len(game.ships) > 0:
+            t0 = time.perf_counter()
+            lander.update_ai_batch(game.ships, game.level, evaluator)
+            t1 = time.perf_counter()
+            collisions = phases['Game.check_collisions']
+            game.update(dt)
+            t2 = time.perf_counter()
+            phases['Genome.eval'] += t1 - t0
+            phases['Ship.update'] += t2 - t1 - (phases['Game.check_collisions'] - collisions)
+            ticks += 1
+
+        t = time.perf_counter()
+        lander.spawn_and_reset(screen_rect, game, population)
+        phases['spawn_and_reset'] += time.perf_counter() - t
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'population': population,
+        'generations': generations,
+        'seconds': elapsed,
+        'ticks': ticks,
+        'ticks_per_s': ticks / elapsed,
+        'generations_per_s': generations / elapsed,
+        'phase_seconds': phases,
+    }
+    if trace_memory:
+        result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    if resource is not None:
+        # ru_maxrss is in kB on Linux, the peak of the whole process so far
+        result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    return result
+
+
+def report(result):
+    print('Population {population}: {generations} generations, {ticks} ticks in {seconds:.2f}s'.format(**result))
+    print('  {:.0f} ticks/s, {:.2f} generations/s'.format(result['ticks_per_s'], result['generations_per_s']))
+    phases = result['phase_seconds']
+    for name in PHASES:
+        print('  {:<22} {:7.2f}s {:6.1%}'.format(name, phases[name], phases[name] / result['seconds']))
+    if 'peak_traced_mb' in result:
+        print('  peak traced memory {:.1f} MB'.format(result['peak_traced_mb']))
+    if 'peak_rss_mb' in result:
+        print('  peak RSS {:.1f} MB'.format(result['peak_rss_mb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--population', type=int, nargs='+', default=[50])
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scalar-physics', action='store_true', help='update ships one by one instead of with VectorPhysics')
+    parser.add_argument('--trace-memory', action='store_true', help='measure peak Python allocations with tracemalloc, slows the run down')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    for population in args.population:
+        result = run(population, args.generations, seed=args.seed, vector_physics=not args.scalar_physics,
+                     trace_memory=args.trace_memory)
+        report(result)
+        results.append(result)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Times the math2d primitives the game relies on.
+
+Run from the repository root:
+    python -m benchmarks.bench_math2d --json before.json
+    ... change math2d ...
+    python -m benchmarks.bench_math2d --json after.json
+    python -m benchmarks.bench_math2d --compare before.json after.json
+
+Every case is run on the same seeded inputs. The result of a case is the
+best of --repeat runs in nanoseconds per operation. --compare exits with
+status 1 if any case got slower by more than --threshold.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+from math2d import Vec2d, Rect2d
+from math2d.matrix2d import Matrix2d
+from math2d.ray2d import Ray2D
+from math2d.shapes import Segment2D
+
+
+def random_vec(scale=100):
+    return Vec2d(random.uniform(-scale, scale), random.uniform(-scale, scale))
+
+
+def random_rect():
+    l, t = random.uniform(0, 100), random.uniform(0, 100)
+    return Rect2d(l, t, l + random.uniform(1, 50), t + random.uniform(1, 50))
+
+
+def make_cases(size):
+    """
+    Returns (name, function) pairs. Every function runs its operation once
+    on each of size prepared inputs.
+    """
+    random.seed(1)
+    a = [random_vec() for _ in range(size)]
+    b = [random_vec() for _ in range(size)]
+    angles = [random.uniform(0, 360) for _ in range(size)]
+    segments = [(Segment2D(random_vec(), random_vec()), Segment2D(random_vec(), random_vec())) for _ in range(size)]
+    rays = [(Ray2D(random_vec(), random_vec(1)), Ray2D(random_vec(), random_vec(1))) for _ in range(size)]
+    rects = [(random_rect(), random_rect()) for _ in range(size)]
+    matrices = [(Matrix2d(3, 3, [random.uniform(-1, 1) for _ in range(9)]), Matrix2d(3, 3, [random.uniform(-1, 1) for _ in range(9)])) for _ in range(size)]
+    transforms = [Matrix2d(2, 2, [random.uniform(-1, 1) for _ in range(4)]) for _ in range(size)]
+
+    def vec_add():
+        for x, y in zip(a, b):
+            x + y
+
+    def vec_iadd():
+        acc = Vec2d(0, 0)
+        for x in a:
+            acc += x
+
+    def vec_sub():
+        for x, y in zip(a, b):
+            x - y
+
+    def vec_mul_scalar():
+        for x, s in zip(a, angles):
+            x * s
+
+    def vec_imul_scalar():
+        acc = Vec2d(1, 1)
+        for _ in a:
+            acc *= 1.0001
+
+    def vec_iadd_scaled():
+        acc = Vec2d(0, 0)
+        for x in a:
+            acc += x * 0.033
+
+    def vec_add_scaled():
+        acc = Vec2d(0, 0)
+        for x in a:
+            acc.add_scaled(x, 0.033)
+
+    def vec_rotated():
+        for x, angle in zip(a, angles):
+            x.rotated(angle)
+
+    def vec_length():
+        for x in a:
+            x.length
+
+    def segment_intersect():
+        for s1, s2 in segments:
+            s1.intersect_with(s2)
+
+    def ray_intersect():
+        for r1, r2 in rays:
+            r1.intersect(r2)
+
+    def rect_and():
+        for r1, r2 in rects:
+            r1 & r2
+
+    def rect_or():
+        for r1, r2 in rects:
+            r1 | r2
+
+    def matrix_mul():
+        for m1, m2 in matrices:
+            m1 * m2
+
+    def matrix_mul_vec():
+        for m, x in zip(transforms, a):
+            m * x
+
+    return [
+        ('Vec2d.__add__', vec_add),
+        ('Vec2d.__iadd__', vec_iadd),
+        ('Vec2d.__sub__', vec_sub),
+        ('Vec2d.__mul__ scalar', vec_mul_scalar),
+        ('Vec2d.__imul__ scalar', vec_imul_scalar),
+        ('Vec2d += Vec2d * dt', vec_iadd_scaled),
+        ('Vec2d.add_scaled', vec_add_scaled),
+        ('Vec2d.rotated', vec_rotated),
+        ('Vec2d.length', vec_length),
+        ('Segment2D.intersect_with', segment_intersect),
+        ('Ray2D.intersect', ray_intersect),
+        ('Rect2d.__and__', rect_and),
+        ('Rect2d.__or__', rect_or),
+        ('Matrix2d.__mul__', matrix_mul),
+        ('Matrix2d.__mul__ Vec2d', matrix_mul_vec),
+    ]
+
+
+def run(size, repeat, only=None):
+    results = {}
+    for name, func in make_cases(size):
+        if only is not None and only not in name:
+            continue
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results[name] = best / size * 1e9
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'size': size,
+        'repeat': repeat,
+        'ns_per_op': results,
+    }
+
+
+def compare(before, after, threshold):
+    """
+    Prints the change of every case and returns the names of the ones that
+    got slower by more than threshold
+    """
+    regressions = []
+    print('{:<28} {:>12} {:>12} {:>9}'.format('case', 'before ns', 'after ns', 'change'))
+    for name, old in before['ns_per_op'].items():
+        new = after['ns_per_op'].get(name)
+        if new is None:
+            print('{:<28} {:>12.1f} {:>12} {:>9}'.format(name, old, '-', 'missing'))
+            continue
+        change = new / old - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('{:<28} {:>12.1f} {:>12.1f} {:>+8.1%}{}'.format(name, old, new, change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000, help='operations per run')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--only', help='only run cases containing this text')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', nargs='+', metavar='JSON',
+                        help='compare a saved run with another saved run, or with a fresh run if only one is given')
+    parser.add_argument('--threshold', type=float, default=0.10, help='slowdown counted as a regression, 0.10 is 10%%')
+    args = parser.parse_args()
+
+    if args.compare is not None and len(args.compare) > 2:
+        parser.error('--compare takes one or two files')
+
+    if args.compare is not None and len(args.compare) == 2:
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+    else:
+        after = run(args.size, args.repeat, args.only)
+        for name, ns in after['ns_per_op'].items():
+            print('{:<28} {:10.1f} ns'.format(name, ns))
+        if args.json is not None:
+            with open(args.json, 'w') as f:
+                json.dump(after, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        print()
+        regressions = compare(before, after, args.threshold)
+        if len(regressions) > 0:
+            print('{} regression(s) over {:.0%}'.format(len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import pickle
+import random
+import tempfile
+
+import neat
+
+CHECKPOINT_PREFIX = 'checkpoint_'
+CHECKPOINT_SUFFIX = '.pkl'
+
+
+def checkpoint_path(directory, generation):
+    return os.path.join(directory, '{}{:08d}{}'.format(CHECKPOINT_PREFIX, generation, CHECKPOINT_SUFFIX))
+
+
+def list_checkpoints(directory):
+    """
+    Returns the (generation, path) pairs of the checkpoints in directory,
+    oldest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(CHECKPOINT_PREFIX) and name.endswith(CHECKPOINT_SUFFIX):
+            generation = name[len(CHECKPOINT_PREFIX):-len(CHECKPOINT_SUFFIX)]
+            if generation.isdigit():
+                found.append((int(generation), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def save_checkpoint(directory, generation, genomes, ship_specs, level, fitness_history, *, speciation=None, keep=3):
+    """
+    Writes the state needed to resume training at the given generation.
+
+    ship_specs holds a (start position, max fuel) pair per genome. With a
+    neat.Speciation its species and the species of every genome are saved
+    too, so resuming does not start speciating from scratch. The file
+    is written to a temporary name and renamed into place, so a crash never
+    leaves a half written checkpoint behind. Only the newest keep
+    checkpoints are kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = {
+        'generation': generation,
+        'genomes': neat.population_to_bytes(genomes),
+        'ships': list(ship_specs),
+        'floor': [p.as_tup() for p in level.floor],
+        'index_landing': level.index_landing,
+        'random_state': random.getstate(),
+        'fitness_history': list(fitness_history),
+        'species_ids': [g.species_id for g in genomes],
+        'speciation': speciation.state() if speciation is not None else None,
+    }
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        path = checkpoint_path(directory, generation)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if keep > 0:
+        for _, old in list_checkpoints(directory)[:-keep]:
+            os.remove(old)
+    return path
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint and restores the RNG
+    state. The genomes are decoded, everything else is returned as saved.
+    Checkpoints from before speciation was saved have no 'speciation'.
+    """
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    state['genomes'] = neat.population_from_bytes(state['genomes'])
+    for g, species_id in zip(state['genomes'], state.get('species_ids', [])):
+        g.species_id = species_id
+    state.setdefault('speciation', None)
+    random.setstate(state['random_state'])
+    return state
+
+
+def load_latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    if len(checkpoints) == 0:
+        return None
+    return load_checkpoint(checkpoints[-1][1])
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class CheckpointTest(unittest.TestCase):
+    def test_round_trip(self):
+        from math2d import Vec2d
+
+        class FakeLevel:
+            floor = [Vec2d(0, 500), Vec2d(0, 600), Vec2d(128, 600)]
+            index_landing = 1
+
+        random.seed(21)
+        genomes = [neat.random_genome(10, node_mut_rate=0.05, con_mut_rate=0.15) for _ in range(5)]
+        specs = [((640, 360), 50)] * len(genomes)
+        speciation = neat.Speciation(threshold=1.0)
+        speciation.speciate(genomes)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for generation in range(1, 6):
+                save_checkpoint(tmp, generation, genomes, specs, FakeLevel, [1, 2, 3], speciation=speciation, keep=2)
+            self.assertEqual([g for g, _ in list_checkpoints(tmp)], [4, 5])
+            expected = random.random()
+
+            random.seed(0)
+            state = load_latest_checkpoint(tmp)
+            # Saved after the RNG was used for the last time
+            self.assertEqual(random.random(), expected)
+
+        self.assertEqual(state['generation'], 5)
+        self.assertEqual(state['ships'], specs)
+        self.assertEqual(state['floor'], [(0, 500), (0, 600), (128, 600)])
+        self.assertEqual(state['index_landing'], 1)
+        self.assertEqual(state['fitness_history'], [1, 2, 3])
+        self.assertEqual([g.to_bytes() for g in state['genomes']], [g.to_bytes() for g in genomes])
+        self.assertEqual([g.species_id for g in state['genomes']], [g.species_id for g in genomes])
+        self.assertEqual(state['speciation']['species_ids'], [s.id for s in speciation.species])
+
+    def test_missing_directory(self):
+        self.assertIsNone(load_latest_checkpoint('/nonexistent/checkpoints'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import numpy as np
+
+
+def segment_hits_box(x1, y1, x2, y2, l, t, r, b):
+    """
+    Checks if the segment (x1, y1) - (x2, y2) touches the closed box
+    [l, r] x [t, b]. Works on plain numbers, so nothing gets allocated.
+    """
+    # Bounding boxes must overlap
+    if max(x1, x2) < l or min(x1, x2) > r:
+        return False
+    if max(y1, y2) < t or min(y1, y2) > b:
+        return False
+
+    # The box corners must not all lie strictly on the same side of the line
+    dx = x2 - x1
+    dy = y2 - y1
+    c1 = dx * (t - y1) - dy * (l - x1)
+    c2 = dx * (t - y1) - dy * (r - x1)
+    c3 = dx * (b - y1) - dy * (l - x1)
+    c4 = dx * (b - y1) - dy * (r - x1)
+    if c1 > 0 and c2 > 0 and c3 > 0 and c4 > 0:
+        return False
+    if c1 < 0 and c2 < 0 and c3 < 0 and c4 < 0:
+        return False
+    return True
+
+
+class FloorIndex:
+    """
+    Floor polyline indexed by x.
+
+    The x axis is split into buckets as wide as the shortest floor step and
+    every bucket lists the segments overlapping it. Since the floor x
+    coordinates are monotonic, a ship narrower than a step only has to be
+    tested against the one or two segments under it.
+    """
+
+    def __init__(self, floor):
+        self.segments = []
+        self.flat = []
+        for p1, p2 in zip(floor, floor[1:]):
+            self.segments.append((p1.x, p1.y, p2.x, p2.y))
+            self.flat.append(p1.y == p2.y)
+        # Same data as arrays for batch_collisions
+        self.segment_array = np.array(self.segments, dtype=float).reshape(len(self.segments), 4)
+        self.flat_array = np.array(self.flat, dtype=bool)
+
+        if len(floor) == 0:
+            self.min_x = 0
+            self.bucket_size = 1
+            self.buckets = []
+            return
+
+        self.min_x = min(p.x for p in floor)
+        max_x = max(p.x for p in floor)
+        steps = [abs(x2 - x1) for x1, _, x2, _ in self.segments if x1 != x2]
+        self.bucket_size = min(steps) if len(steps) > 0 else 1
+
+        self.buckets = [[] for _ in range(self.bucket(max_x) + 1)]
+        for i, (x1, _, x2, _) in enumerate(self.segments):
+            for k in range(self.bucket(min(x1, x2)), self.bucket(max(x1, x2)) + 1):
+                self.buckets[k].append(i)
+
+    def bucket(self, x):
+        return int((x - self.min_x) // self.bucket_size)
+
+    def candidates(self, l, r):
+        """
+        Returns the indices of the segments that may overlap [l, r] along x
+        """
+        if len(self.buckets) == 0:
+            return []
+        first = max(self.bucket(l), 0)
+        last = min(self.bucket(r), len(self.buckets) - 1)
+        if first > last:
+            return []
+        if first == last:
+            return self.buckets[first]
+        found = []
+        for k in range(first, last + 1):
+            for i in self.buckets[k]:
+                if i not in found:
+                    found.append(i)
+        return found
+
+    def collide(self, l, t, r, b):
+        """
+        Tests the box [l, r] x [t, b] against the floor. Returns a pair of
+        flags: whether it touches any segment and whether one of the touched
+        segments is flat.
+        """
+        hit = False
+        hit_flat = False
+        for i in self.candidates(l, r):
+            x1, y1, x2, y2 = self.segments[i]
+            if segment_hits_box(x1, y1, x2, y2, l, t, r, b):
+                hit = True
+                if self.flat[i]:
+                    hit_flat = True
+        return hit, hit_flat
+
+
+def batch_collisions(pos, vel, angle_deg, area, floor_index, *, box_size=(25, 50), max_angle=2, max_vel=(10, 20)):
+    """
+    Collision and landing detection for a whole population in one pass.
+
+    Takes the (N, 2) positions and velocities and (N,) angles in degrees of
+    the ships and returns three (N,) boolean arrays: which ships left the
+    area, which touched the floor and which of those touched the flat
+    landing segment slowly and upright enough to count as landed. Ships
+    outside the area are not tested against the floor.
+    """
+    pos = np.asarray(pos, dtype=float)
+    vel = np.asarray(vel, dtype=float)
+    angle_deg = np.asarray(angle_deg, dtype=float)
+    x = pos[:, 0]
+    y = pos[:, 1]
+    outside = (x < 0) | (x > area[0]) | (y < 0) | (y > area[1])
+
+    # Same box as Ship.get_bounds, one row per ship and one column per segment
+    l = np.trunc(x)[:, None]
+    t = np.trunc(y)[:, None]
+    r = l + box_size[0]
+    b = t + box_size[1]
+    x1, y1, x2, y2 = floor_index.segment_array.T
+
+    touch = (np.maximum(x1, x2) >= l) & (np.minimum(x1, x2) <= r)
+    touch &= (np.maximum(y1, y2) >= t) & (np.minimum(y1, y2) <= b)
+    dx = x2 - x1
+    dy = y2 - y1
+    c1 = dx * (t - y1) - dy * (l - x1)
+    c2 = dx * (t - y1) - dy * (r - x1)
+    c3 = dx * (b - y1) - dy * (l - x1)
+    c4 = dx * (b - y1) - dy * (r - x1)
+    touch &= ~((c1 > 0) & (c2 > 0) & (c3 > 0) & (c4 > 0))
+    touch &= ~((c1 < 0) & (c2 < 0) & (c3 < 0) & (c4 < 0))
+
+    hit = touch.any(axis=1) & ~outside
+    hit_flat = (touch & floor_index.flat_array).any(axis=1) & ~outside
+    landed = hit_flat & (np.abs(angle_deg - 90) < max_angle)
+    landed &= (np.abs(vel[:, 0]) < max_vel[0]) & (np.abs(vel[:, 1]) < max_vel[1])
+    return outside, hit, landed
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import random
+import unittest
+
+class FloorIndexTest(unittest.TestCase):
+    def test_matches_does_intersect(self):
+        from main import Level, does_intersect, to_rect
+        from math2d import Vec2d
+        from math2d.shapes import Segment2D
+
+        random.seed(5)
+        for _ in range(5):
+            level = Level.generate(1280, 480, 720, 10)
+            index = FloorIndex(level.floor)
+            for _ in range(500):
+                pos = Vec2d(random.uniform(0, 1280), random.uniform(400, 720))
+                rect = to_rect(pos, 25, 50)
+                expected_hit = False
+                expected_flat = False
+                for p1, p2 in zip(level.floor, level.floor[1:]):
+                    if does_intersect(rect, Segment2D(p1, p2)):
+                        expected_hit = True
+                        expected_flat = expected_flat or p1.y == p2.y
+                got = index.collide(rect.left, rect.top, rect.right, rect.bottom)
+                self.assertEqual(got, (expected_hit, expected_flat))
+
+    def test_few_candidates(self):
+        from math2d import Vec2d
+        floor = [Vec2d(0, 500), Vec2d(0, 600)] + [Vec2d(i * 128, 600 + i) for i in range(1, 11)]
+        index = FloorIndex(floor)
+        for x in range(0, 1280, 7):
+            self.assertLessEqual(len(index.candidates(x, x + 25)), 3)
+
+
+class BatchCollisionsTest(unittest.TestCase):
+    def test_matches_floor_index(self):
+        from main import Game, Level, AiShip
+        from math2d import Vec2d
+
+        random.seed(11)
+        area = Vec2d(1280, 720)
+        for _ in range(5):
+            level = Level.generate(1280, 480, 720, 10)
+            game = Game(level, [], area)
+            ships = []
+            for _ in range(500):
+                s = AiShip(Vec2d(random.uniform(-20, 1300), random.uniform(-20, 740)), 50, with_fire=False)
+                s.vel = Vec2d(random.uniform(-15, 15), random.uniform(-25, 25))
+                s.angle.deg = random.uniform(85, 95)
+                ships.append(s)
+            # Put a few ships right on the landing pad
+            p1 = level.floor[level.index_landing]
+            for s in ships[:20]:
+                s.pos = Vec2d(p1.x + random.uniform(0, 100), p1.y - 50)
+
+            outside, hit, landed = batch_collisions(
+                [s.pos.as_tup() for s in ships],
+                [s.vel.as_tup() for s in ships],
+                [s.angle.deg for s in ships],
+                area.as_tup(), level.floor_index)
+            for s, o, h, l in zip(ships, outside, hit, landed):
+                self.assertEqual((o, h, l), game.collide(s))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import hashlib
+import struct
+from collections import OrderedDict
+
+
+def level_hash(level, area):
+    """
+    Stable hex digest of the floor, the landing site and the area
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(struct.pack('<qdd', level.index_landing, area.x, area.y))
+    for p in level.floor:
+        h.update(struct.pack('<dd', p.x, p.y))
+    return h.hexdigest()
+
+
+class FitnessCache:
+    """
+    Fitness of already simulated ships, keyed by genome structure, level,
+    start position, fuel and time step.
+
+    The simulation of a single ship is deterministic, so a ship equal to one
+    simulated before, like an elite re-spawned on the same level, gets the
+    same fitness without being simulated again. Entries are evicted least
+    recently used first once there are more than capacity of them.
+
+    Fitness must only depend on the ship itself, so the cache must not be
+    combined with the fitness bound rule of pruning.Pruning.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, ship, level_digest, dt):
+        return (ship.genome.structure_hash(), level_digest, ship.start_pos.as_tup(), ship.maxFuel, dt)
+
+    def get(self, key):
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key, fitness):
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def split(self, game, ships, dt):
+        """
+        Gives the ships found in the cache their fitness and returns the
+        keys of the others, which still have to be simulated
+        """
+        digest = level_hash(game.level, game.area)
+        pending = {}
+        for s in ships:
+            key = self.key(s, digest, dt)
+            fitness = self.get(key)
+            if fitness is None:
+                pending[id(s)] = key
+            else:
+                s.fitness = fitness
+        return pending
+
+    def store(self, ships, pending):
+        """
+        Remembers the fitness of the simulated ships returned by split
+        """
+        for s in ships:
+            key = pending.get(id(s))
+            if key is not None:
+                self.put(key, s.fitness)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import random
+import unittest
+
+class FitnessCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = FitnessCache(capacity=2)
+        cache.put('a', 1.0)
+        cache.put('b', 2.0)
+        self.assertEqual(cache.get('a'), 1.0)
+        cache.put('c', 3.0)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1.0)
+        self.assertEqual(cache.get('c'), 3.0)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_cached_fitness_matches_simulation(self):
+        import neat
+        from main import Game, Level, AiShip, evaluate_generation
+        from math2d import Vec2d
+        from physics import VectorPhysics
+
+        random.seed(24)
+        dt = 0.033
+        area = Vec2d(1280, 720)
+        level = Level.generate(1280, 480, 720, 10)
+        genomes = [neat.random_genome(random.randint(0, 30), node_mut_rate=0.1, con_mut_rate=0.2) for _ in range(20)]
+
+        cache = FitnessCache()
+        results = []
+        for c in (None, cache, cache):
+            game = Game(level, [AiShip(area / 2, 50, genome=g.clone(), with_fire=False) for g in genomes], area, physics=VectorPhysics())
+            game.reset_physics()
+            ships = list(game.ships)
+            evaluate_generation(game, dt, cache=c)
+            self.assertEqual(len(game.dead), len(ships))
+            results.append([s.fitness for s in ships])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertGreaterEqual(cache.hits, len(genomes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import pygame
+
+TEXT_COLOR = (0, 255, 0)
+
+
+class Hud:
+    """
+    Text overlay that only renders a line again when its text changed.
+
+    Every line is drawn under a key naming it, e.g. 'generation', and the
+    last text and surface of every key are kept. Values that stay the same
+    between frames cost a single blit.
+
+    SysFont scans the installed fonts every time it is called, so the font
+    is loaded once and kept. It does not survive pygame.quit(), call clear()
+    after quitting to drop it before pygame is initialized again.
+    """
+
+    def __init__(self, *, font_name='Arial', size=20, color=TEXT_COLOR):
+        self.font_name = font_name
+        self.size = size
+        self.color = color
+        self.font = None
+        self.lines = {}
+
+    def clear(self):
+        self.font = None
+        self.lines = {}
+
+    def line(self, screen, key, text, pos):
+        cached = self.lines.get(key)
+        if cached is None or cached[0] != text:
+            if self.font is None:
+                if not pygame.font.get_init():
+                    pygame.font.init()
+                self.font = pygame.font.SysFont(self.font_name, self.size)
+            cached = (text, self.font.render(text, False, self.color))
+            self.lines[key] = cached
+        screen.blit(cached[1], pos)
+
+    def block(self, screen, key, texts, pos):
+        """
+        Draws texts as consecutive lines starting at pos
+        """
+        x, y = pos
+        for i, text in enumerate(texts):
+            self.line(screen, (key, i), text, (x, y))
+            y += self.size
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class HudTest(unittest.TestCase):
+    def test_renders_changed_lines_only(self):
+        hud = Hud()
+        screen = pygame.Surface((200, 100))
+        hud.block(screen, 'stats', ['Generation: 3', 'Alive: 0'], (0, 0))
+        first, second = hud.lines[('stats', 0)][1], hud.lines[('stats', 1)][1]
+        font = hud.font
+        hud.block(screen, 'stats', ['Generation: 3', 'Alive: 1'], (0, 0))
+        self.assertIs(hud.lines[('stats', 0)][1], first)
+        self.assertIsNot(hud.lines[('stats', 1)][1], second)
+        self.assertIs(hud.font, font)
+
+    def test_reinitialized_pygame(self):
+        hud = Hud()
+        screen = pygame.Surface((200, 40))
+        hud.line(screen, 'a', 'fuel: 42', (0, 0))
+        pygame.quit()
+        hud.clear()
+        pygame.init()
+        # Would crash with the font of the previous pygame session
+        hud.line(screen, 'a', 'fuel: 41', (0, 0))
+        self.assertEqual(hud.lines['a'][0], 'fuel: 41')
+
+    def test_same_pixels_as_render(self):
+        hud = Hud()
+        screen = pygame.Surface((200, 40))
+        hud.line(screen, 'a', 'fuel: 42', (3, 4))
+        hud.line(screen, 'a', 'fuel: 42', (3, 4))
+        expected = pygame.Surface((200, 40))
+        expected.blit(hud.font.render('fuel: 42', False, TEXT_COLOR), (3, 4))
+        self.assertEqual(pygame.image.tobytes(screen, 'RGB'), pygame.image.tobytes(expected, 'RGB'))
+
+
+if __name__ == '__main__':
+    unittest.main()
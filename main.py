@@ -1,12 +1,26 @@
 import math
 import pygame
 import random
+import numpy as np
 from pygame.locals import *
-from math2d import Vec2d, Angle
+from math2d import Vec2d, Vec2dArray, Angle
 from math2d.ray2d import Ray2D
 from math2d.shapes import Segment2D
 import neat
+import neat_batch
+from physics import VectorPhysics
+from collision import FloorIndex, batch_collisions
+from parallel import ParallelEvaluator
+from pruning import Pruning
+from fitness_cache import FitnessCache
+import particles
+from particles import Fire
+from hud import Hud
+import profiling
+import checkpoint
 import copy
+import time
+import argparse
 
 def to_rect(pos, w, h):
     r = Rect(0, 0, 0, 0)
@@ -30,44 +44,8 @@ def does_intersect(rect, seg):
 def clamp(val, v_min, v_max):
     return min(val, max(val, v_min), v_max)
 
-class FireParticle:
-
-    def __init__(self, pos, direct, life):
-        self.particlePos = Vec2d(pos)
-        self.particleDir = Vec2d(direct)
-        self.life = life
-
-    def draw(self, screen):
-        pygame.draw.circle(screen, (200 + self.life, 50 +  4 * self.life,self.life * 5), self.particlePos.as_int_tup(), 2, 1)
-
-    def update(self):
-        self.life -= 1
-        self.particlePos += self.particleDir
-
-class Fire:
-
-    def __init__(self):
-        self.particles = []
-
-    def update(self, thrust, thrustPos, thrustAng):
-        newParticles = []
-        for ember in self.particles:
-            ember.update()
-            if ember.life > 0:
-                newParticles.append(ember)
-        for _ in range(thrust):
-            fireDir = Vec2d(-thrust/2, 0)
-            fireDir.rotate(-thrustAng + random.randint(0, 10))
-            firePos = thrustPos + Vec2d(0, 25).rotated(90 - thrustAng)
-            newParticles.append(FireParticle(firePos, fireDir, random.randint(20, 50)))
-        self.particles = newParticles
-
-    def draw(self, screen):
-        for ptcl in self.particles:
-            ptcl.draw(screen)
-
 class Ship:
-    def __init__(self, pos, maxfuel, *, color=(0, 200, 0)):
+    def __init__(self, pos, maxfuel, *, color=(0, 200, 0), with_fire=True):
         self.start_pos = copy.copy(pos)
         self.pos = pos
         self.vel = Vec2d(0, 0)
@@ -83,7 +61,10 @@ class Ship:
         self.landed = False
         self.dead = False
 
-        self.fire = Fire()
+        # Headless runs never draw, so they skip the particle work entirely
+        self.fire = Fire() if with_fire else None
+        # Row of the ship in the physics backend, if the game uses one
+        self.physics_index = -1
 
     def reset(self):
         self.pos = self.start_pos
@@ -98,6 +79,14 @@ class Ship:
     def get_bound_rect(self):
         return to_rect(self.pos, 25, 50)
 
+    def get_bounds(self):
+        """
+        Same box as get_bound_rect as a (left, top, right, bottom) tuple,
+        without building a Rect
+        """
+        l, t = self.pos.as_int_tup()
+        return l, t, l + 25, t + 50
+
     def draw(self, screen):
         br = self.get_bound_rect()
         pos = br.center
@@ -123,9 +112,6 @@ class Ship:
         # Debug draw bound rect
         # pygame.draw.rect(screen, (255, 0, 0), br, 2)
 
-        if not self.landed and not self.dead:
-            self.fire.draw(screen)
-
     def update(self, dt):
         if self.fuel <= 0:
             self.thrust = 0
@@ -134,11 +120,17 @@ class Ship:
         self.force.length = self.thrust * 20
         self.force += Vec2d(0, -3 * 20) # gravity is a bit weak
         self.force.y *= -1
-        self.pos += self.vel * dt
-        self.vel += self.force * dt# we asume that mass == 1
+        self.pos.add_scaled(self.vel, dt)
+        self.vel.add_scaled(self.force, dt) # we asume that mass == 1
         self.fuel -= self.thrust * dt
 
-        if not self.landed and not self.dead:
+        self.post_update(dt)
+
+    def post_update(self, dt):
+        """
+        Called after the physics step, whichever backend ran it
+        """
+        if not self.landed and not self.dead and self.fire is not None:
             self.fire.update(self.thrust, self.pos + Vec2d(25/2, 50/2), self.angle.deg)
 
 class Level:
@@ -170,6 +162,8 @@ class Level:
         self.floor = floor_pts
         self.ceiling = ceiling_pts
         self.index_landing = -1
+        self.floor_index = FloorIndex(floor_pts)
+        self.floor_array = Vec2dArray(floor_pts)
 
     def draw(self, screen):
         color = (150, 50, 0)
@@ -177,7 +171,7 @@ class Level:
         screen_rect = screen.get_rect()
         if len(self.floor) > 1:
             floor_pts = [screen_rect.bottomleft]
-            floor_pts += list(map(lambda p: p.as_int_tup(), self.floor))
+            floor_pts += self.floor_array.as_int_tup_list()
             floor_pts.append(screen_rect.bottomright)
             pygame.draw.polygon(screen, color, floor_pts)
             if self.index_landing >= 0:
@@ -187,65 +181,150 @@ class Level:
         if len(self.ceiling) > 1:
             pygame.draw.polygon(screen, color, list(map(lambda p: p.as_int_tup(), self.ceiling)))
 
+class Background:
+    """
+    Sky, stars and terrain rendered once to a surface and blitted every
+    frame. stars is a Vec2dArray. The surface is rendered again whenever
+    it is drawn for a different Level object than last time, e.g. after
+    Level.generate.
+    """
+    SKY_COLOR = (0, 0, 33)
+    STAR_COLOR = (255, 255, 255)
+
+    def __init__(self, size, stars):
+        self.size = size
+        self.stars = stars
+        self.surface = None
+        self.level = None
+
+    def render(self, level):
+        surface = pygame.Surface(self.size)
+        surface.fill(self.SKY_COLOR)
+        for star in self.stars.as_int_tup_list():
+            pygame.draw.circle(surface, self.STAR_COLOR, star, 2)
+        level.draw(surface)
+        if pygame.display.get_surface() is not None:
+            # Match the pixel format of the screen for faster blits
+            surface = surface.convert()
+        self.surface = surface
+        self.level = level
+
+    def draw(self, screen, level):
+        if self.surface is None or self.level is not level:
+            self.render(level)
+        screen.blit(self.surface, (0, 0))
+
 class Game:
-    def __init__(self, level, ships, area):
+    MAX_LANDING_ANGLE = 2
+    MAX_LANDING_VEL_X = 10
+    MAX_LANDING_VEL_Y = 20
+
+    def __init__(self, level, ships, area, *, physics=None, pruning=None, particles=None, profiler=None):
         self.level = level
         self.ships = ships
         self.area = area
         self.dead = []
+        self.physics = physics
+        self.pruning = pruning
+        # ParticlePool the exhaust of the ships is emitted into, if drawn
+        self.particles = particles
+        self.profiler = profiler if profiler is not None else profiling.disabled
+        self.reset_physics()
+
+    def reset_physics(self):
+        """
+        Loads the current ships into the physics backend, if there is one.
+        Has to be called whenever a new set of ships is spawned.
+        """
+        if self.physics is not None:
+            self.physics.load(self.ships)
 
 
     def check_landed(self, ship):
         # print("angle", ship.angle.deg)
         # print("velocity", ship.vel)
-        angle_check = abs(ship.angle.deg - 90) < 2
-        vertical_speed_check = abs(ship.vel.y) < 20
-        horizontal_speed_check = abs(ship.vel.x) < 10
+        angle_check = abs(ship.angle.deg - 90) < self.MAX_LANDING_ANGLE
+        vertical_speed_check = abs(ship.vel.y) < self.MAX_LANDING_VEL_Y
+        horizontal_speed_check = abs(ship.vel.x) < self.MAX_LANDING_VEL_X
         return angle_check and vertical_speed_check and horizontal_speed_check
 
-    def check_collisions(self):
-        # Check if outside
-        to_remove = set()
+    def collide(self, ship):
+        """
+        Returns (outside, hit, landed) for a single ship
+        """
+        if ship.pos.x < 0 or ship.pos.x > self.area.x:
+            return (True, False, False)
+        elif ship.pos.y < 0 or ship.pos.y > self.area.y:
+            return (True, False, False)
+
+        hit, hit_flat = self.level.floor_index.collide(*ship.get_bounds())
+        return (False, hit, hit and hit_flat and self.check_landed(ship))
+
+    def batch_collide(self):
+        """
+        Same as calling collide on every ship, using the arrays of the
+        physics backend
+        """
+        rows = np.array([s.physics_index for s in self.ships], dtype=np.intp)
+        outside, hit, landed = batch_collisions(
+            self.physics.pos[rows],
+            self.physics.vel[rows],
+            np.degrees(self.physics.angle[rows]),
+            self.area.as_tup(),
+            self.level.floor_index,
+            max_angle=self.MAX_LANDING_ANGLE,
+            max_vel=(self.MAX_LANDING_VEL_X, self.MAX_LANDING_VEL_Y))
+        return zip(outside.tolist(), hit.tolist(), landed.tolist())
 
-        for s in self.ships:
-            if s.pos.x < 0 or s.pos.x > self.area.x:
-                to_remove.add(s)
-            elif s.pos.y < 0 or s.pos.y > self.area.y:
-                to_remove.add(s)
-
-        for s in to_remove:
-            self.ships.remove(s)
-            if not s.landed:
-                s.dead = True
-            self.dead.append(s)
-
-        # Check if colided with ground
-        to_remove = set()
-
-        for p1, p2 in zip(self.level.floor, self.level.floor[1:]):
-            seg = Segment2D(p1, p2)
-            for s in self.ships:
-                if does_intersect(s.get_bound_rect(), seg):
-                    if seg.beg.y == seg.end.y:
-                        if self.check_landed(s):
-                            s.landed = True
-                    to_remove.add(s)
+    def check_collisions(self):
+        if len(self.ships) == 0:
+            return
 
-        for s in to_remove:
-            self.ships.remove(s)
+        if self.physics is not None:
+            results = self.batch_collide()
+        else:
+            results = map(self.collide, self.ships)
+
+        # Rebuild the list of live ships in one pass
+        alive = []
+        for s, (outside, hit, landed) in zip(self.ships, results):
+            if not outside and not hit:
+                alive.append(s)
+                continue
+            if landed:
+                s.landed = True
             if not s.landed:
                 s.dead = True
             self.dead.append(s)
+        self.ships = alive
 
     def update(self, dt):
-        for s in self.ships:
-            if not s.landed:
-                s.update(dt)
+        profiler = self.profiler
+        if self.particles is not None:
+            # Age the exhaust before the ships emit this tick's particles
+            with profiler.phase('particles'):
+                self.particles.step()
+        with profiler.phase('physics'):
+            if self.physics is not None:
+                self.physics.update([s for s in self.ships if not s.landed], dt)
+            else:
+                for s in self.ships:
+                    if not s.landed:
+                        s.update(dt)
         
-        self.check_collisions()
-
-    def draw(self, screen):
-        self.level.draw(screen)
+        alive = len(self.ships)
+        with profiler.phase('collision'):
+            self.check_collisions()
+        profiler.count('finished', alive - len(self.ships))
+        if self.pruning is not None:
+            alive = len(self.ships)
+            with profiler.phase('pruning'):
+                self.pruning.prune(self)
+            profiler.count('pruned', alive - len(self.ships))
+
+    def draw(self, screen, *, draw_level=True):
+        if draw_level:
+            self.level.draw(screen)
 
         for s in self.dead:
             s.draw(screen)
@@ -253,9 +332,12 @@ class Game:
         for s in self.ships:
             s.draw(screen)
 
+        if self.particles is not None:
+            self.particles.draw(screen)
+
 class AiShip(Ship):
-    def __init__(self, pos, maxfuel, *, color=(0, 200, 0), genome=None):
-        super().__init__(pos, maxfuel, color=color)
+    def __init__(self, pos, maxfuel, *, color=(0, 200, 0), genome=None, with_fire=True):
+        super().__init__(pos, maxfuel, color=color, with_fire=with_fire)
         if genome is None:
             self.genome = neat.Genome(7, 2, node_mut_rate=0.1, con_mut_rate=0.2)
         else:
@@ -263,6 +345,7 @@ class AiShip(Ship):
 
         self.fitness = 0
         self.time_alive = 0
+        self.ai_index = -1
 
     def update_ai(self, level):
         landing_site = level.landing_center()
@@ -275,7 +358,13 @@ class AiShip(Ship):
         #         height = self.pos.get_distance(crosses[0])
         #         break
 
-        new_angle, new_thrust = self.genome.eval([self.pos.x, self.pos.y, self.vel.x, self.vel.y, landing_site.x, landing_site.y, self.angle.deg])
+        new_angle, new_thrust = self.genome.compile().eval(self.ai_inputs(landing_site))
+        self.apply_ai_output(new_angle, new_thrust)
+
+    def ai_inputs(self, landing_site):
+        return [self.pos.x, self.pos.y, self.vel.x, self.vel.y, landing_site.x, landing_site.y, self.angle.deg]
+
+    def apply_ai_output(self, new_angle, new_thrust):
         new_angle, new_thrust = new_angle * 180, new_thrust * 5
         self.angle.deg = clamp(new_angle, 0, 180)
         if new_thrust > 4:
@@ -285,9 +374,9 @@ class AiShip(Ship):
         self.thrust = int(new_thrust)
         # self.thrust = abs(int(clamp(new_thrust, 0, 4)))
 
-    def update(self, dt):
+    def post_update(self, dt):
         self.time_alive += dt
-        super().update(dt)
+        super().post_update(dt)
 
     def calculate_fitness(self, level, max_dist):
         landing_site = level.landing_center()
@@ -306,37 +395,60 @@ class AiShip(Ship):
         
         self.fitness = fitness
 
-def draw_text(screen, font, text, pos):
-    surf = font.render(text, False, (0, 255, 0))
-    screen.blit(surf, pos)
+    def fitness_upper_bound(self):
+        """
+        The best fitness the ship could still get: landing right on the
+        landing site, upright and still, without burning any more fuel
+        """
+        return self.fuel - 10 * len(self.genome.nodes) + 9000
+
+def build_evaluator(ships):
+    """
+    Packs the genomes of a freshly spawned generation into a batch evaluator
+    and remembers each ship's row in it.
+    """
+    ai_ships = [s for s in ships if isinstance(s, AiShip)]
+    for i, s in enumerate(ai_ships):
+        s.ai_index = i
+    return neat_batch.PopulationEvaluator([s.genome for s in ai_ships])
+
+def update_ai_batch(ships, level, evaluator):
+    """
+    Same as calling update_ai on every AiShip, but evaluates all genomes as
+    one batch.
+    """
+    ai_ships = [s for s in ships if isinstance(s, AiShip)]
+    if len(ai_ships) == 0:
+        return
+    landing_site = level.landing_center()
+    inputs = [s.ai_inputs(landing_site) for s in ai_ships]
+    rows = [s.ai_index for s in ai_ships]
+    outputs = evaluator.eval(inputs, rows).tolist()
+    for s, (new_angle, new_thrust) in zip(ai_ships, outputs):
+        s.apply_ai_output(new_angle, new_thrust)
+
+hud = Hud(font_name='Arial', size=20)
 
 def debug_hud(ship, screen, pos=Vec2d(50, 50)):
-    size = 20
-    font = pygame.font.SysFont('Arial', size)
-    draw_text(screen, font, 'thrust: {}'.format(ship.thrust), pos.as_int_tup())
-    pos.y += size
-    draw_text(screen, font, 'velocity: {}'.format(ship.vel), pos.as_int_tup())
-    pos.y += size
-    draw_text(screen, font, 'Angle: {}'.format(ship.angle.deg), pos.as_int_tup())
-    pos.y += size
-    draw_text(screen, font, 'fuel: {}'.format(ship.fuel), pos.as_int_tup())
+    text = [
+        'thrust: {}'.format(ship.thrust),
+        'velocity: {}'.format(ship.vel),
+        'Angle: {}'.format(ship.angle.deg),
+        'fuel: {}'.format(ship.fuel),
+    ]
+    pos = pos.as_int_tup()
+    hud.block(screen, ('ship', pos), text, pos)
 
 tracked = None
 def ai_debug_hud(screen, game, generation, fitness, *, tracking=False):
     global tracked
-    size = 20
-    pos = 50
-    font = pygame.font.SysFont('Arial', size)
 
     text = [
         'Generation: {}'.format(generation),
         'Fitness: {}'.format(fitness),
         'Alive: {}'.format(len(game.ships))
     ]
-
-    for t in text:
-        draw_text(screen, font, t, (50, pos))
-        pos += size
+    hud.block(screen, 'population', text, (50, 50))
 
     if tracking:
         if tracked is None or tracked.dead:
@@ -347,42 +459,121 @@ def ai_debug_hud(screen, game, generation, fitness, *, tracking=False):
 
         debug_hud(tracked, screen, Vec2d(screen.get_rect().width - 400, 50))
 
-def spawn_and_reset(screen, game, cnt, *, reset_level=False):
+def profile_hud(screen, profiler):
+    lines = profiler.summary()
+    x = 50
+    y = screen.get_rect().height - 50 - hud.size * len(lines)
+    hud.block(screen, 'profile', lines, (x, y))
+
+def spawn_and_reset(screen_rect, game, cnt, *, reset_level=False, evaluated=False, crossover_rate=0.25, speciation=None, verbose=False):
+    """
+    Breeds the next generation from the dead ships. If evaluated is set,
+    their fitness was already computed elsewhere, e.g. by ParallelEvaluator.
+    crossover_rate is the share of offspring bred by mating two of the top
+    ships instead of cloning one. With a neat.Speciation the whole
+    population breeds within its species instead of only the top 4.
+    With verbose the genome of the best ship is printed.
+    """
     global tracked
-    screen_rect = screen.get_rect()
     if cnt < 3:
         cnt = 3
     ai_ships = []
     for s in game.dead:
         if isinstance(s, AiShip):
-            s.calculate_fitness(game.level, screen_rect.width)
+            if not evaluated:
+                s.calculate_fitness(game.level, screen_rect.width)
             ai_ships.append(s)
 
     screen_size = Vec2d(*screen_rect.size)
 
     game.dead = []
     game.ships = []
+    if game.particles is not None:
+        # The exhaust of the last generation would hang over the new ships
+        game.particles.clear()
     if reset_level:
         game.level = Level.generate(screen_size.x, 2 * screen_size.y // 3, screen_size.y, 10)
     reproduceable = sorted(ai_ships, key=lambda s: s.fitness, reverse=True)[:4] # the top 3
 
     tf = reproduceable[0].fitness
-    print(reproduceable[0].genome)
+    if verbose:
+        print(reproduceable[0].genome)
+
+    if speciation is not None:
+        fitness = {id(s.genome): s.fitness for s in ai_ships}
+        offspring = speciation.breed([s.genome for s in ai_ships], cnt, lambda g: fitness[id(g)], crossover_rate=crossover_rate)
+        parent = reproduceable[0]
+        for genome in offspring:
+            game.ships.append(AiShip(Vec2d(*screen_rect.center), parent.maxFuel, color=(20, 190, 250), genome=genome, with_fire=parent.fire is not None))
+        reproduceable = []
 
     for s in reproduceable:
         s.reset()
+        with_fire = s.fire is not None
         # game.ships.append(s)
-        game.ships.append(AiShip(Vec2d(*screen_rect.center), s.maxFuel, color=(20, 190, 250), genome=copy.deepcopy(s.genome)))
+        game.ships.append(AiShip(Vec2d(*screen_rect.center), s.maxFuel, color=(20, 190, 250), genome=s.genome.clone(copy_on_write=True), with_fire=with_fire))
         for _ in range(cnt // 3 - 1):
-            new_genome = copy.deepcopy(s.genome)
+            if len(reproduceable) > 1 and random.random() < crossover_rate:
+                partner = random.choice([o for o in reproduceable if o is not s])
+                fitter, other = (s, partner) if s.fitness >= partner.fitness else (partner, s)
+                new_genome = fitter.genome.mate(other.genome)
+            else:
+                new_genome = s.genome.clone(copy_on_write=True)
             new_genome.mutate()
-            game.ships.append(AiShip(Vec2d(*screen_rect.center), s.maxFuel, color=(20, 190, 250), genome=new_genome))
+            game.ships.append(AiShip(Vec2d(*screen_rect.center), s.maxFuel, color=(20, 190, 250), genome=new_genome, with_fire=with_fire))
 
     tracked = game.ships[0]
+    game.reset_physics()
 
     return tf
 
-def main():
+class StepScheduler:
+    """
+    Decides how many fixed dt simulation steps run per rendered frame.
+
+    Normally steps_per_frame steps run per frame and the frame rate is
+    capped at fps, so the simulation plays in real time. If steps_per_frame
+    is 0, or in fast forward mode, steps run until budget seconds of the
+    frame are used up and the frame rate is not capped, so training goes as
+    fast as it can while the window keeps handling events. timer returns
+    the current time in seconds.
+    """
+
+    def __init__(self, *, steps_per_frame=1, budget=0.016, fps=30, timer=time.perf_counter):
+        self.steps_per_frame = steps_per_frame
+        self.budget = budget
+        self.fps = fps
+        self.timer = timer
+        self.fast_forward = False
+        self.clock = pygame.time.Clock()
+
+    def toggle_fast_forward(self):
+        self.fast_forward = not self.fast_forward
+
+    def run(self, step):
+        """
+        Calls step as many times as this frame allows and returns the count
+        """
+        if self.fast_forward or self.steps_per_frame <= 0:
+            deadline = self.timer() + self.budget
+            steps = 0
+            while True:
+                step()
+                steps += 1
+                if self.timer() >= deadline:
+                    return steps
+        for _ in range(self.steps_per_frame):
+            step()
+        return self.steps_per_frame
+
+    def end_frame(self):
+        if self.fast_forward or self.steps_per_frame <= 0:
+            self.clock.tick()
+        else:
+            self.clock.tick(self.fps)
+
+def main(*, checkpoint_dir=None, checkpoint_every=0, resume=False, speciation=False, pruning=None, steps_per_frame=1,
+         profile=False, profile_log=None, profile_every=1000):
     screen_size = Vec2d(1280, 720)
     pygame.init()
     pygame.font.init()
@@ -391,7 +582,10 @@ def main():
     ship = None #Ship(screen_size / 2, 50, color=(20, 190, 250))
     level = Level.generate(screen_size.x, 2 * screen_size.y // 3, screen_size.y, 10)
 
-    game = Game(level, [], screen_size)
+    log_file = open(profile_log, 'a') if profile_log is not None else None
+    # Always created so P can turn it on while running
+    profiler = profiling.Profiler(enabled=profile, log_file=log_file, log_every=profile_every)
+    game = Game(level, [], screen_size, pruning=pruning, particles=particles.default_pool, profiler=profiler)
     if ship is not None:
         game.ships.append(ship)
 
@@ -403,7 +597,15 @@ def main():
         s.genome.mutate()
         game.ships.append(s)
 
-    # clock = pygame.time.Clock()
+    fitness_history = []
+    species = neat.Speciation(target_species=10) if speciation else None
+    if resume and checkpoint_dir is not None:
+        restored = resume_game(checkpoint_dir, game, speciation=species)
+        if restored is not None:
+            generation, fitness_history = restored
+            if len(fitness_history) > 0:
+                top_fitness = fitness_history[-1]
+    evaluator = build_evaluator(game.ships)
 
     num_stars = 100
     stars = []
@@ -413,10 +615,31 @@ def main():
             random.randrange(0, screen_size.y)
         )
         stars.append(star)
+    stars = Vec2dArray(stars)
+    background = Background(screen_size.as_int_tup(), stars)
 
-    fitness_history = []
+    dt = 0.033
+    scheduler = StepScheduler(steps_per_frame=steps_per_frame, fps=round(1 / dt))
+
+    def step():
+        nonlocal generation, top_fitness, evaluator
+        with profiler.phase('ai'):
+            update_ai_batch(game.ships, game.level, evaluator)
+        profiler.count('ai evals', len(game.ships))
+        game.update(dt)
+        profiler.tick()
+        if len(game.ships) == 0:
+            print('=============================================')
+            print('Generation:', generation)
+            generation += 1
+            with profiler.phase('reproduction'):
+                # top_fitness = spawn_and_reset(screen, game, generation_cnt, reset_level=generation % 5 == 0)
+                top_fitness = spawn_and_reset(screen.get_rect(), game, generation_cnt, reset_level=False, speciation=species, verbose=True)
+                evaluator = build_evaluator(game.ships)
+            fitness_history.append(top_fitness)
+            if checkpoint_dir is not None and checkpoint_every > 0 and generation % checkpoint_every == 0:
+                checkpoint_game(checkpoint_dir, game, generation, fitness_history, species)
 
-    asap = False
     mainloop = True
     while mainloop:
         for event in pygame.event.get():
@@ -427,7 +650,9 @@ def main():
                     mainloop = False # user pressed ESC
             elif event.type == pygame.KEYUP:
                 if event.key == pygame.K_SPACE:
-                    asap = not asap
+                    scheduler.toggle_fast_forward()
+                elif event.key == pygame.K_p:
+                    profiler.toggle()
                 if ship is not None: # Debug stuff
                     if event.key == pygame.K_UP:
                         if ship.thrust < 4:
@@ -442,41 +667,32 @@ def main():
                         if ship.angle.deg > 0:
                             ship.angle.deg = ship.angle.deg - 10
 
-        # dt = clock.get_time() / 1000
-        # if dt > 1:
-        dt = 0.033
-
-
         # Update
-        for s in game.ships:
-            if isinstance(s, AiShip):
-                s.update_ai(game.level)
-        game.update(dt)
-        if len(game.ships) == 0:
-            print('=============================================')
-            print('Generation:', generation)
-            generation += 1
-            # top_fitness = spawn_and_reset(screen, game, generation_cnt, reset_level=generation % 5 == 0)
-            top_fitness = spawn_and_reset(screen, game, generation_cnt, reset_level=False)
-            fitness_history.append(top_fitness)
+        scheduler.run(step)
 
         # Drawing
-        screen.fill((0, 0, 33))
-        ai_debug_hud(screen, game, generation, top_fitness, tracking=True)
-
-        for star in stars:
-            pygame.draw.circle(screen, (255, 255, 255), star.as_int_tup(), 2)
-
-        game.draw(screen)
-        if ship is not None:
-            debug_hud(ship, screen)
-        pygame.display.flip()
-        # if not asap:
-        #     clock.tick(60)
+        with profiler.phase('drawing'):
+            background.draw(screen, game.level)
+            ai_debug_hud(screen, game, generation, top_fitness, tracking=True)
+            game.draw(screen, draw_level=False)
+            if ship is not None:
+                debug_hud(ship, screen)
+            if profiler.enabled:
+                profile_hud(screen, profiler)
+            pygame.display.flip()
+        scheduler.end_frame()
         
     
+    if checkpoint_dir is not None:
+        # Keep the genomes of the unfinished generation around
+        checkpoint_game(checkpoint_dir, game, generation, fitness_history, species)
+    if log_file is not None:
+        log_file.close()
+
     # print evolution history
     pygame.quit()
+    # Its font belongs to the pygame session that just ended
+    hud.clear()
     import matplotlib
     from matplotlib import pyplot as plt
     matplotlib.style.use('dark_background')
@@ -485,5 +701,254 @@ def main():
     plt.plot(fitness_history)
     plt.show()
 
+def checkpoint_game(directory, game, generation, fitness_history, speciation=None):
+    """
+    Saves the genomes of the current generation along with everything
+    needed to carry on training from it
+    """
+    ai_ships = [s for s in game.ships + game.dead if isinstance(s, AiShip)]
+    return checkpoint.save_checkpoint(
+        directory,
+        generation,
+        [s.genome for s in ai_ships],
+        [(s.start_pos.as_tup(), s.maxFuel) for s in ai_ships],
+        game.level,
+        fitness_history,
+        speciation=speciation)
+
+def resume_game(directory, game, *, with_fire=True, speciation=None):
+    """
+    Replaces the level and ships of the game with the ones from the latest
+    checkpoint in directory, and the species of speciation with the saved
+    ones if the checkpoint has them. Returns the generation counter and
+    fitness history, or None if there is nothing to resume from.
+    """
+    state = checkpoint.load_latest_checkpoint(directory)
+    if state is None:
+        return None
+    neat.default_registry.register(state['genomes'])
+    if speciation is not None and state['speciation'] is not None:
+        speciation.restore(state['speciation'])
+        neat.default_registry.register([s.representative for s in speciation.species])
+
+    game.level = Level([Vec2d(p) for p in state['floor']])
+    game.level.index_landing = state['index_landing']
+    game.dead = []
+    game.ships = []
+    for genome, (pos, max_fuel) in zip(state['genomes'], state['ships']):
+        game.ships.append(AiShip(Vec2d(pos), max_fuel, color=(20, 190, 250), genome=genome, with_fire=with_fire))
+    game.reset_physics()
+    print('Resumed from generation', state['generation'])
+    return state['generation'], state['fitness_history']
+
+def simulate_generation(game, dt):
+    """
+    Steps the game until every ship has landed, crashed or left the area.
+    Returns the number of ticks it took.
+    """
+    if len(game.ships) == 0:
+        return 0
+    profiler = game.profiler
+    with profiler.phase('ai'):
+        evaluator = build_evaluator(game.ships)
+    ticks = 0
+    while len(game.ships) > 0:
+        with profiler.phase('ai'):
+            update_ai_batch(game.ships, game.level, evaluator)
+        profiler.count('ai evals', len(game.ships))
+        game.update(dt)
+        profiler.tick()
+        ticks += 1
+    return ticks
+
+def evaluate_generation(game, dt, *, pool=None, cache=None):
+    """
+    Simulates the ships of the game until they all finished, on the pool if
+    one is given, and sets the fitness of every one of them. Ships found in
+    the FitnessCache are not simulated at all. All ships end up in
+    game.dead. Returns the number of ticks simulated.
+    """
+    ships = list(game.ships)
+    pending = None
+    if cache is not None:
+        pending = cache.split(game, ships, dt)
+        game.ships = [s for s in ships if id(s) in pending]
+        game.profiler.count('cached', len(ships) - len(pending))
+
+    if pool is not None:
+        # The workers run the ticks, only the time waiting for them shows up here
+        with game.profiler.phase('workers'):
+            ticks = pool.evaluate(game, game.ships)
+        game.dead.extend(game.ships)
+        game.ships = []
+    else:
+        ticks = simulate_generation(game, dt)
+        for s in game.dead:
+            s.calculate_fitness(game.level, game.area.x)
+
+    if pending is not None:
+        cache.store(ships, pending)
+        game.dead.extend(s for s in ships if id(s) not in pending)
+    return ticks
+
+def train_headless(generations, *, population=50, dt=0.033, screen_size=(1280, 720), reset_level_every=0, report_every=10, vector_physics=True, workers=0,
+                   checkpoint_dir=None, checkpoint_every=0, resume=False, speciation=False, pruning=None, fitness_cache=None,
+                   profile=False, profile_log=None, profile_every=1000):
+    """
+    Runs the evolution loop without a window, fonts or exhaust particles.
+    The physics is stepped at a fixed dt as fast as the CPU allows. With
+    workers > 0 every generation is evaluated on a pool of processes.
+    With a checkpoint_dir the population is saved every checkpoint_every
+    generations, and resume picks up from the latest checkpoint there.
+    With speciation the next generation is bred by neat.Speciation.
+    A pruning.Pruning retires hopeless ships before they finish. Ships
+    already in the fitness_cache, like re-spawned elites, are not simulated.
+    With profile the phases are timed like in main and printed at the end.
+    Returns the top fitness of every generation.
+    """
+    if fitness_cache is not None and pruning is not None and pruning.fitness_bound:
+        raise ValueError("The fitness cache cannot be combined with the fitness bound pruning rule")
+    screen_size = Vec2d(screen_size)
+    screen_rect = Rect(0, 0, *screen_size.as_int_tup())
+    level = Level.generate(screen_size.x, 2 * screen_size.y // 3, screen_size.y, 10)
+    log_file = open(profile_log, 'a') if profile_log is not None else None
+    profiler = profiling.Profiler(enabled=profile, log_file=log_file, log_every=profile_every)
+    game = Game(level, [], screen_size, physics=VectorPhysics() if vector_physics else None, pruning=pruning, profiler=profiler)
+
+    for _ in range(population):
+        s = AiShip(screen_size / 2, 50, color=(20, 190, 250), with_fire=False)
+        s.genome.mutate()
+        game.ships.append(s)
+    game.reset_physics()
+
+    first_generation = 1
+    fitness_history = []
+    species = neat.Speciation(target_species=10) if speciation else None
+    if resume and checkpoint_dir is not None:
+        restored = resume_game(checkpoint_dir, game, with_fire=False, speciation=species)
+        if restored is not None:
+            done, fitness_history = restored
+            first_generation = done + 1
+
+    pool = ParallelEvaluator(workers, dt=dt, pruning=pruning) if workers > 0 else None
+    ticks = 0
+    start = time.perf_counter()
+    try:
+        for generation in range(first_generation, generations + 1):
+            ticks += evaluate_generation(game, dt, pool=pool, cache=fitness_cache)
+
+            reset_level = reset_level_every > 0 and generation % reset_level_every == 0
+            with profiler.phase('reproduction'):
+                top_fitness = spawn_and_reset(screen_rect, game, population, reset_level=reset_level, evaluated=True, speciation=species)
+            fitness_history.append(top_fitness)
+            if checkpoint_dir is not None and checkpoint_every > 0 and generation % checkpoint_every == 0:
+                with profiler.phase('checkpoint'):
+                    checkpoint_game(checkpoint_dir, game, generation, fitness_history, species)
+            if report_every > 0 and generation % report_every == 0:
+                elapsed = time.perf_counter() - start
+                trained = generation - first_generation + 1
+                print('Generation: {}, fitness: {:.2f}, {:.2f} generations/s, {:.0f} ticks/s'.format(
+                    generation, top_fitness, trained / elapsed, ticks / elapsed))
+                if species is not None:
+                    print('Species:', ', '.join(str(len(s.members)) for s in species.species))
+    finally:
+        if pool is not None:
+            pool.close()
+        if log_file is not None:
+            log_file.close()
+
+    elapsed = time.perf_counter() - start
+    trained = max(generations - first_generation + 1, 0)
+    print('Trained {} generations in {:.2f}s ({:.2f} generations/s)'.format(trained, elapsed, trained / elapsed))
+    if fitness_cache is not None:
+        print('Fitness cache: {} hits, {} misses'.format(fitness_cache.hits, fitness_cache.misses))
+    if profiler.enabled:
+        print('\n'.join(profiler.summary()))
+    return fitness_history
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Evolve lander AIs')
+    parser.add_argument('--headless', action='store_true', help='train without a window at full CPU speed')
+    parser.add_argument('--generations', type=int, default=100, help='number of generations to train in headless mode')
+    parser.add_argument('--population', type=int, default=50, help='number of ships per generation in headless mode')
+    parser.add_argument('--workers', type=int, default=0, help='number of worker processes evaluating each generation in headless mode')
+    parser.add_argument('--checkpoint-dir', help='directory to save the population to')
+    parser.add_argument('--checkpoint-every', type=int, default=10, help='save a checkpoint every that many generations')
+    parser.add_argument('--resume', action='store_true', help='continue from the latest checkpoint in --checkpoint-dir')
+    parser.add_argument('--speciation', action='store_true', help='breed within NEAT species instead of from the top 4 ships')
+    parser.add_argument('--prune', action='store_true', help='retire ships that are out of fuel and ascending or cannot reach the top 4')
+    parser.add_argument('--max-time', type=float, help='with --prune, also retire ships after that many simulated seconds')
+    parser.add_argument('--steps-per-frame', type=int, default=1, help='simulation steps per rendered frame, 0 runs as many as fit in 16ms')
+    parser.add_argument('--profile', action='store_true', help='time the phases of the main loop and show them on the HUD, P toggles it; headless prints them at the end')
+    parser.add_argument('--profile-log', help='append the profile totals as JSON lines to this file')
+    parser.add_argument('--profile-every', type=int, default=1000, help='ticks between lines of --profile-log')
+    parser.add_argument('--fitness-cache', type=int, default=0, help='remember the fitness of that many simulated ships in headless mode')
+    return parser.parse_args()
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class BackgroundTest(unittest.TestCase):
+    def test_rendered_once_per_level(self):
+        random.seed(26)
+        stars = Vec2dArray([(random.randrange(0, 320), random.randrange(0, 240)) for _ in range(20)])
+        background = Background((320, 240), stars)
+        level = Level.generate(320, 160, 240, 10)
+        screen = pygame.Surface((320, 240))
+
+        background.draw(screen, level)
+        surface = background.surface
+        background.draw(screen, level)
+        self.assertIs(background.surface, surface)
+
+        expected = pygame.Surface((320, 240))
+        expected.fill(Background.SKY_COLOR)
+        for star in stars.as_int_tup_list():
+            pygame.draw.circle(expected, Background.STAR_COLOR, star, 2)
+        level.draw(expected)
+        self.assertEqual(pygame.image.tobytes(screen, 'RGB'), pygame.image.tobytes(expected, 'RGB'))
+
+        background.draw(screen, Level.generate(320, 160, 240, 10))
+        self.assertIsNot(background.surface, surface)
+
+class StepSchedulerTest(unittest.TestCase):
+    def test_fixed_steps(self):
+        calls = []
+        scheduler = StepScheduler(steps_per_frame=3, timer=lambda: 0.0)
+        self.assertEqual(scheduler.run(lambda: calls.append(1)), 3)
+        self.assertEqual(len(calls), 3)
+
+    def test_budget(self):
+        now = [0.0]
+        def step():
+            now[0] += 0.005
+        scheduler = StepScheduler(steps_per_frame=1, budget=0.016, timer=lambda: now[0])
+        scheduler.toggle_fast_forward()
+        # Steps until the fourth one passes the 16 ms budget
+        self.assertEqual(scheduler.run(step), 4)
+
+        def slow_step():
+            now[0] += 1.0
+        # At least one step, even if it alone blows the budget
+        self.assertEqual(scheduler.run(slow_step), 1)
+
+        scheduler = StepScheduler(steps_per_frame=0, budget=0.016, timer=lambda: now[0])
+        self.assertEqual(scheduler.run(step), 4)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    pruning = Pruning(max_time=args.max_time) if args.prune else None
+    options = dict(checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every, resume=args.resume, speciation=args.speciation,
+                   pruning=pruning, profile=args.profile, profile_log=args.profile_log, profile_every=args.profile_every)
+    if args.headless:
+        cache = FitnessCache(args.fitness_cache) if args.fitness_cache > 0 else None
+        if cache is not None and pruning is not None:
+            # Fitness of ships retired by the bound rule depends on the rest of the generation
+            pruning.fitness_bound = False
+        train_headless(args.generations, population=args.population, workers=args.workers, fitness_cache=cache, **options)
+    else:
+        main(steps_per_frame=args.steps_per_frame, **options)
\ No newline at end of file
@@ -1,3 +1,4 @@
 from math2d.vec2d import *
 from math2d.rect2d import *
-from math2d.angle import *
\ No newline at end of file
+from math2d.angle import *
+from math2d.vec2d_array import Vec2dArray
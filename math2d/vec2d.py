@@ -1,5 +1,6 @@
 import operator
 import math
+import numbers
  
 class Vec2d(object):
     """2d vector class, supports vector and scalar operators,
@@ -8,12 +9,12 @@ class Vec2d(object):
     __slots__ = ['x', 'y']
  
     def __init__(self, x_or_pair, y = None):
-        if y == None:
-            self.x = x_or_pair[0]
-            self.y = x_or_pair[1]
-        else:
+        if y is not None:
             self.x = x_or_pair
             self.y = y
+        else:
+            self.x = x_or_pair[0]
+            self.y = x_or_pair[1]
  
     def __len__(self):
         return 2
@@ -63,6 +64,10 @@ class Vec2d(object):
         if isinstance(other, Vec2d):
             return Vec2d(f(self.x, other.x),
                          f(self.y, other.y))
+        elif isinstance(other, numbers.Real):
+            # numpy scalars have __getitem__ too
+            return Vec2d(f(self.x, other),
+                         f(self.y, other))
         elif (hasattr(other, "__getitem__")):
             return Vec2d(f(self.x, other[0]),
                          f(self.y, other[1]))
@@ -72,7 +77,7 @@ class Vec2d(object):
  
     def _r_o2(self, other, f):
         "Any two-operator operation where the right operand is a vec2d"
-        if (hasattr(other, "__getitem__")):
+        if not isinstance(other, numbers.Real) and hasattr(other, "__getitem__"):
             return Vec2d(f(other[0], self.x),
                          f(other[1], self.y))
         else:
@@ -81,7 +86,7 @@ class Vec2d(object):
  
     def _io(self, other, f):
         "inplace operator"
-        if (hasattr(other, "__getitem__")):
+        if not isinstance(other, numbers.Real) and hasattr(other, "__getitem__"):
             self.x = f(self.x, other[0])
             self.y = f(self.y, other[1])
         else:
@@ -89,75 +94,104 @@ class Vec2d(object):
             self.y = f(self.y, other)
         return self
  
+    # The arithmetic operators check for the two common cases, another
+    # Vec2d and a plain int or float, by exact type first. Everything else,
+    # including subclasses and numpy scalars, goes through the generic
+    # handlers above.
+
     # Addition
     def __add__(self, other):
-        if isinstance(other, Vec2d):
+        tp = type(other)
+        if tp is Vec2d:
             return Vec2d(self.x + other.x, self.y + other.y)
-        elif hasattr(other, "__getitem__"):
-            return Vec2d(self.x + other[0], self.y + other[1])
-        else:
+        elif tp is float or tp is int:
             return Vec2d(self.x + other, self.y + other)
+        return self._o2(other, operator.add)
     __radd__ = __add__
     
     def __iadd__(self, other):
-        if isinstance(other, Vec2d):
+        tp = type(other)
+        if tp is Vec2d:
             self.x += other.x
             self.y += other.y
-        elif hasattr(other, "__getitem__"):
-            self.x += other[0]
-            self.y += other[1]
-        else:
+            return self
+        elif tp is float or tp is int:
             self.x += other
             self.y += other
-        return self
+            return self
+        return self._io(other, operator.add)
  
     # Subtraction
     def __sub__(self, other):
-        if isinstance(other, Vec2d):
+        tp = type(other)
+        if tp is Vec2d:
             return Vec2d(self.x - other.x, self.y - other.y)
-        elif (hasattr(other, "__getitem__")):
-            return Vec2d(self.x - other[0], self.y - other[1])
-        else:
+        elif tp is float or tp is int:
             return Vec2d(self.x - other, self.y - other)
+        return self._o2(other, operator.sub)
     def __rsub__(self, other):
-        if isinstance(other, Vec2d):
-            return Vec2d(other.x - self.x, other.y - self.y)
-        if (hasattr(other, "__getitem__")):
-            return Vec2d(other[0] - self.x, other[1] - self.y)
-        else:
+        tp = type(other)
+        if tp is float or tp is int:
             return Vec2d(other - self.x, other - self.y)
+        return self._r_o2(other, operator.sub)
     def __isub__(self, other):
-        if isinstance(other, Vec2d):
+        tp = type(other)
+        if tp is Vec2d:
             self.x -= other.x
             self.y -= other.y
-        elif (hasattr(other, "__getitem__")):
-            self.x -= other[0]
-            self.y -= other[1]
-        else:
+            return self
+        elif tp is float or tp is int:
             self.x -= other
             self.y -= other
-        return self
+            return self
+        return self._io(other, operator.sub)
  
     # Multiplication
     def __mul__(self, other):
-        if isinstance(other, Vec2d):
-            return Vec2d(self.x*other.y, self.y*other.y)
-        if (hasattr(other, "__getitem__")):
-            return Vec2d(self.x*other[0], self.y*other[1])
-        else:
+        tp = type(other)
+        if tp is float or tp is int:
             return Vec2d(self.x*other, self.y*other)
+        elif tp is Vec2d:
+            return Vec2d(self.x*other.x, self.y*other.y)
+        return self._o2(other, operator.mul)
     __rmul__ = __mul__
     
     def __imul__(self, other):
-        if isinstance(other, Vec2d):
+        tp = type(other)
+        if tp is float or tp is int:
+            self.x *= other
+            self.y *= other
+            return self
+        elif tp is Vec2d:
             self.x *= other.x
             self.y *= other.y
-        elif (hasattr(other, "__getitem__")):
-            self.x *= other[0]
-            self.y *= other[1]
+            return self
+        return self._io(other, operator.mul)
+
+    # Fused operations
+    def add_scaled(self, other, scale):
+        """
+        In place self += other * scale without the temporary vector,
+        e.g. pos.add_scaled(vel, dt)
+        """
+        if type(other) is Vec2d:
+            self.x += other.x * scale
+            self.y += other.y * scale
         else:
-            self.x *= other
-            self.y *= other
+            self.x += other[0] * scale
+            self.y += other[1] * scale
+        return self
+
+    def sub_scaled(self, other, scale):
+        """
+        In place self -= other * scale without the temporary vector
+        """
+        if type(other) is Vec2d:
+            self.x -= other.x * scale
+            self.y -= other.y * scale
+        else:
+            self.x -= other[0] * scale
+            self.y -= other[1] * scale
         return self
  
     # Division
@@ -224,10 +258,10 @@ class Vec2d(object):
  
     # Unary operations
     def __neg__(self):
-        return Vec2d(operator.neg(self.x), operator.neg(self.y))
+        return Vec2d(-self.x, -self.y)
  
     def __pos__(self):
-        return Vec2d(operator.pos(self.x), operator.pos(self.y))
+        return Vec2d(+self.x, +self.y)
  
     def __abs__(self):
         return Vec2d(abs(self.x), abs(self.y))
@@ -355,4 +389,72 @@ def v(*arg, **kwarg):
     '''
     Utility function to make constructing vectors more comapct
     '''
-    return Vec2d(*arg, **kwarg)
\ No newline at end of file
+    return Vec2d(*arg, **kwarg)
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class Vec2dOperatorTest(unittest.TestCase):
+    class SubVec(Vec2d):
+        __slots__ = []
+
+    def operands(self):
+        return [Vec2d(3, -2), Vec2d(0.5, 4.25), self.SubVec(2, 7), (1.5, -3), [4, 5],
+                2, -3, 0.25, True, 1e300]
+
+    def check(self, got, x, y):
+        self.assertIs(type(got), Vec2d)
+        self.assertEqual((got.x, got.y), (x, y))
+        self.assertEqual((type(got.x), type(got.y)), (type(x), type(y)))
+
+    def test_binary_operators(self):
+        ops = [(operator.add, operator.iadd), (operator.sub, operator.isub), (operator.mul, operator.imul)]
+        for a in [Vec2d(1, 2), Vec2d(-0.5, 3.75)]:
+            for other in self.operands():
+                if hasattr(other, '__getitem__'):
+                    ox, oy = other[0], other[1]
+                else:
+                    ox, oy = other, other
+                for op, iop in ops:
+                    self.check(op(a, other), op(a.x, ox), op(a.y, oy))
+                    if not isinstance(other, Vec2d):
+                        self.check(op(other, a), op(ox, a.x), op(oy, a.y))
+                    b = Vec2d(a.x, a.y)
+                    result = iop(b, other)
+                    self.assertIs(result, b)
+                    self.check(b, op(a.x, ox), op(a.y, oy))
+
+    def test_fused(self):
+        for other in self.operands()[:5]:
+            for scale in [0.033, 2, -1.5]:
+                pos = Vec2d(10.5, -3)
+                expected = pos + Vec2d(other) * scale
+                self.assertIs(pos.add_scaled(other, scale), pos)
+                self.assertEqual(pos, expected)
+                expected = pos - Vec2d(other) * scale
+                self.assertIs(pos.sub_scaled(other, scale), pos)
+                self.assertEqual(pos, expected)
+
+    def test_numpy_scalars(self):
+        import numpy as np
+        ops = [(operator.add, operator.iadd), (operator.sub, operator.isub), (operator.mul, operator.imul)]
+        for other in [np.float64(2.5), np.float32(0.5), np.int64(3)]:
+            for op, iop in ops:
+                a = Vec2d(1, -2)
+                expected = (op(1, other), op(-2, other))
+                self.assertEqual(op(a, other).as_tup(), expected)
+                self.assertIs(iop(a, other), a)
+                self.assertEqual(a.as_tup(), expected)
+            self.assertEqual((Vec2d(1, -2) / other).as_tup(), (1 / other, -2 / other))
+
+    def test_construct(self):
+        self.assertEqual(Vec2d(1, 0).as_tup(), (1, 0))
+        self.assertEqual(Vec2d((1, 2)).as_tup(), (1, 2))
+        self.assertEqual(Vec2d(Vec2d(3, 4)).as_tup(), (3, 4))
+        self.assertEqual(Vec2d(0, 0).as_tup(), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import numpy as np
+
+if __name__ == '__main__':
+    from vec2d import Vec2d
+else:
+    from .vec2d import Vec2d
+
+
+class Vec2dArray:
+    """
+    Array of 2d vectors stored as one contiguous (N, 2) float array, with
+    the operators and vector functions of Vec2d applied to every row at
+    once.
+
+    The other operand of an operator may be another Vec2dArray or (N, 2)
+    array, a single Vec2d or pair applied to every row, a scalar, or an
+    (N, 1) array with one scalar per row, e.g. scales[:, None]. Anything
+    else follows NumPy broadcasting against the (N, 2) data, so a flat (N,)
+    array is an error rather than a guess. Functions like length or dot
+    return (N,) arrays.
+    """
+    __slots__ = ['data']
+
+    def __init__(self, points=()):
+        if isinstance(points, Vec2dArray):
+            data = points.data.copy()
+        elif isinstance(points, np.ndarray):
+            data = np.array(points, dtype=float)
+        else:
+            points = list(points)
+            data = np.array([(p[0], p[1]) for p in points], dtype=float)
+        self.data = data.reshape(len(data), 2)
+
+    @staticmethod
+    def wrap(data):
+        """
+        Wraps an (N, 2) float array without copying it
+        """
+        array = Vec2dArray.__new__(Vec2dArray)
+        array.data = data
+        return array
+
+    @staticmethod
+    def from_xy(x, y):
+        return Vec2dArray.wrap(np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)]))
+
+    @staticmethod
+    def zeros(n):
+        return Vec2dArray.wrap(np.zeros((n, 2)))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            x, y = self.data[key].tolist()
+            return Vec2d(x, y)
+        return Vec2dArray.wrap(self.data[key])
+
+    def __setitem__(self, key, value):
+        self.data[key] = self._operand(value)
+
+    def __iter__(self):
+        for x, y in self.data.tolist():
+            yield Vec2d(x, y)
+
+    def __repr__(self):
+        return 'Vec2dArray(%s)' % self.data.tolist()
+
+    def __eq__(self, other):
+        if isinstance(other, Vec2dArray):
+            return np.array_equal(self.data, other.data)
+        return NotImplemented
+
+    def copy(self):
+        return Vec2dArray.wrap(self.data.copy())
+
+    def get_x(self):
+        return self.data[:, 0]
+    def set_x(self, value):
+        self.data[:, 0] = value
+    x = property(get_x, set_x, None, "view of the x components")
+
+    def get_y(self):
+        return self.data[:, 1]
+    def set_y(self, value):
+        self.data[:, 1] = value
+    y = property(get_y, set_y, None, "view of the y components")
+
+    # Operand handling
+    def _operand(self, other):
+        """
+        Turns other into something that broadcasts against the (N, 2) data
+        """
+        if isinstance(other, Vec2dArray):
+            return other.data
+        if isinstance(other, Vec2d):
+            return np.array((other.x, other.y))
+        return np.asarray(other, dtype=float)
+
+    # Arithmetic
+    def __add__(self, other):
+        return Vec2dArray.wrap(self.data + self._operand(other))
+    __radd__ = __add__
+
+    def __iadd__(self, other):
+        self.data += self._operand(other)
+        return self
+
+    def __sub__(self, other):
+        return Vec2dArray.wrap(self.data - self._operand(other))
+    def __rsub__(self, other):
+        return Vec2dArray.wrap(self._operand(other) - self.data)
+    def __isub__(self, other):
+        self.data -= self._operand(other)
+        return self
+
+    def __mul__(self, other):
+        return Vec2dArray.wrap(self.data * self._operand(other))
+    __rmul__ = __mul__
+
+    def __imul__(self, other):
+        self.data *= self._operand(other)
+        return self
+
+    def __truediv__(self, other):
+        return Vec2dArray.wrap(self.data / self._operand(other))
+    def __rtruediv__(self, other):
+        return Vec2dArray.wrap(self._operand(other) / self.data)
+    def __itruediv__(self, other):
+        self.data /= self._operand(other)
+        return self
+
+    def __neg__(self):
+        return Vec2dArray.wrap(-self.data)
+
+    def __abs__(self):
+        return Vec2dArray.wrap(np.abs(self.data))
+
+    def add_scaled(self, other, scale):
+        """
+        In place self += other * scale, see Vec2d.add_scaled
+        """
+        self.data += self._operand(other) * self._operand(scale)
+        return self
+
+    # Vector functions
+    def get_length_sqrd(self):
+        return np.einsum('ij,ij->i', self.data, self.data)
+
+    def get_length(self):
+        return np.sqrt(self.get_length_sqrd())
+    length = property(get_length, None, None, "(N,) array of the magnitudes of the vectors")
+
+    def normalized(self):
+        """
+        Unit vectors, zero vectors stay zero like in Vec2d.normalized
+        """
+        length = self.get_length()
+        safe = np.where(length != 0, length, 1)
+        return Vec2dArray.wrap(self.data / safe[:, None])
+
+    def rotate(self, angle_degrees):
+        self.data[:] = self.rotated(angle_degrees).data
+
+    def rotated(self, angle_degrees):
+        radians = np.radians(angle_degrees)
+        cos = np.cos(radians)
+        sin = np.sin(radians)
+        x = self.data[:, 0]
+        y = self.data[:, 1]
+        return Vec2dArray.from_xy(x*cos - y*sin, x*sin + y*cos)
+
+    def get_angle(self):
+        angle = np.degrees(np.arctan2(self.data[:, 1], self.data[:, 0]))
+        return np.where(self.get_length_sqrd() == 0, 0, angle)
+
+    def perpendicular(self):
+        return Vec2dArray.from_xy(-self.data[:, 1], self.data[:, 0])
+
+    def dot(self, other):
+        other = np.broadcast_to(self._operand(other), self.data.shape)
+        return np.einsum('ij,ij->i', self.data, other)
+
+    def cross(self, other):
+        other = np.broadcast_to(self._operand(other), self.data.shape)
+        return self.data[:, 0] * other[:, 1] - self.data[:, 1] * other[:, 0]
+
+    def get_distance(self, other):
+        return np.sqrt(self.get_dist_sqrd(other))
+
+    def get_dist_sqrd(self, other):
+        d = self.data - self._operand(other)
+        return np.einsum('ij,ij->i', d, d)
+
+    # Conversion
+    def as_tup_list(self):
+        return [tuple(p) for p in self.data.tolist()]
+
+    def as_int_tup_list(self):
+        # Truncates like Vec2d.as_int_tup
+        return [tuple(p) for p in self.data.astype(int).tolist()]
+
+    def to_vec2d_list(self):
+        return list(self)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import random
+import unittest
+
+class Vec2dArrayTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(25)
+        self.vecs = [Vec2d(random.uniform(-50, 50), random.uniform(-50, 50)) for _ in range(7)]
+        self.vecs.append(Vec2d(0, 0))
+        self.others = [Vec2d(random.uniform(-50, 50), random.uniform(-50, 50)) for _ in range(8)]
+        self.array = Vec2dArray(self.vecs)
+        self.other_array = Vec2dArray(self.others)
+
+    def assertRowsEqual(self, array, vecs):
+        self.assertEqual(len(array), len(vecs))
+        for got, expected in zip(array, vecs):
+            self.assertAlmostEqual(got.x, expected.x, places=9)
+            self.assertAlmostEqual(got.y, expected.y, places=9)
+
+    def test_operators(self):
+        a, b = self.array, self.other_array
+        self.assertRowsEqual(a + b, [p + q for p, q in zip(self.vecs, self.others)])
+        self.assertRowsEqual(a - b, [p - q for p, q in zip(self.vecs, self.others)])
+        self.assertRowsEqual(a * 2.5, [p * 2.5 for p in self.vecs])
+        self.assertRowsEqual(3 - a, [3 - p for p in self.vecs])
+        self.assertRowsEqual(a + Vec2d(1, 2), [p + Vec2d(1, 2) for p in self.vecs])
+        self.assertRowsEqual(a - (1, 2), [p - (1, 2) for p in self.vecs])
+        self.assertRowsEqual(-a, [-p for p in self.vecs])
+
+        scales = np.arange(len(a), dtype=float)
+        self.assertRowsEqual(a * scales[:, None], [p * s for p, s in zip(self.vecs, scales.tolist())])
+        with self.assertRaises(ValueError):
+            a * scales
+
+        c = a.copy()
+        c.add_scaled(b, 0.033)
+        self.assertRowsEqual(c, [Vec2d(p).add_scaled(q, 0.033) for p, q in zip(self.vecs, self.others)])
+        self.assertRowsEqual(a, self.vecs)
+
+    def test_two_rows(self):
+        # A flat pair means (x, y) no matter how many rows there are
+        a = Vec2dArray([(1, 2), (3, 4)])
+        self.assertRowsEqual(a * np.array([2, 3]), [Vec2d(2, 6), Vec2d(6, 12)])
+        self.assertRowsEqual(a * np.array([[2], [3]]), [Vec2d(2, 4), Vec2d(9, 12)])
+        c = a.copy()
+        c.add_scaled(Vec2d(1, 1), np.array([[0.5], [2]]))
+        self.assertRowsEqual(c, [Vec2d(1.5, 2.5), Vec2d(5, 6)])
+
+    def test_vector_functions(self):
+        a, b = self.array, self.other_array
+        np.testing.assert_allclose(a.length, [p.length for p in self.vecs])
+        np.testing.assert_allclose(a.dot(b), [p.dot(q) for p, q in zip(self.vecs, self.others)])
+        np.testing.assert_allclose(a.cross(b), [p.cross(q) for p, q in zip(self.vecs, self.others)])
+        np.testing.assert_allclose(a.cross(Vec2d(1, 3)), [p.cross(Vec2d(1, 3)) for p in self.vecs])
+        np.testing.assert_allclose(a.get_distance(b), [p.get_distance(q) for p, q in zip(self.vecs, self.others)])
+        np.testing.assert_allclose(a.get_angle(), [p.get_angle() for p in self.vecs], atol=1e-12)
+        self.assertRowsEqual(a.rotated(33), [p.rotated(33) for p in self.vecs])
+        self.assertRowsEqual(a.normalized(), [p.normalized() for p in self.vecs])
+        self.assertRowsEqual(a.perpendicular(), [p.perpendicular() for p in self.vecs])
+
+        c = a.copy()
+        c.rotate(-70)
+        self.assertRowsEqual(c, [p.rotated(-70) for p in self.vecs])
+
+    def test_conversion(self):
+        a = self.array
+        self.assertEqual(a.as_int_tup_list(), [p.as_int_tup() for p in self.vecs])
+        self.assertEqual(a.as_tup_list(), [p.as_tup() for p in self.vecs])
+        self.assertEqual(a[2], self.vecs[2])
+        view = a[1:3]
+        view.x = 0
+        self.assertEqual(a[1].x, 0)
+        self.assertEqual(len(Vec2dArray()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,45 @@
+import copy
+import hashlib
 import math
 import random
+import struct
 from enum import Enum
 
+# Binary genome format, all little endian:
+#   header: magic, num inputs, num outputs, node and connection mutation
+#           thresholds, current innovation, node count, connection count
+#   default activation of new nodes (one byte, version 2 only)
+#   nodes: one byte per node type, then one byte per node activation
+#          (version 2 only, version 1 genomes use sigmoid everywhere)
+#   connections: in node, out node, weight, enabled and innovation arrays
+GENOME_MAGIC_V1 = b'NEAT'
+GENOME_MAGIC = b'NEA2'
+GENOME_HEADER = struct.Struct('<4sIIddqII')
+# in node, out node, weight, enabled of a connection in Genome.structure_hash
+STRUCTURE_CONNECTION = struct.Struct('<IId?')
+
+def sigmoid(value):
+    return 1 / (1 + math.exp(-3 * value))
+
+def identity(value):
+    return value
+
+def relu(value):
+    return value if value > 0 else 0.0
+
+
+# Activation functions by name. The order of ACTIVATION_NAMES is part of the
+# binary genome format, only ever append to it. A lookup table sigmoid
+# briefly used index 4 and was dropped for being slower than math.exp.
+ACTIVATIONS = {
+    'sigmoid': sigmoid,
+    'tanh': math.tanh,
+    'relu': relu,
+    'identity': identity,
+}
+ACTIVATION_NAMES = ['sigmoid', 'tanh', 'relu', 'identity']
+
+
 class NodeType(Enum):
     INPUT = 0 
     OUTPUT = 1
@@ -9,8 +47,11 @@ class NodeType(Enum):
 
 
 class Node:
-    def __init__(self, tp):
+    def __init__(self, tp, activation='sigmoid'):
+        if activation not in ACTIVATIONS:
+            raise ValueError("Unknown activation: {}".format(activation))
         self.tp = tp
+        self.activation = activation
         self.value = 0
         self.connected_to = set()
     
@@ -19,7 +60,12 @@ class Node:
 
     def activate(self):
         # return self.value
-        return 1 / (1 + math.exp(-3 * self.value))
+        return ACTIVATIONS[self.activation](self.value)
+
+    def copy(self):
+        node = Node(self.tp, self.activation)
+        node.connected_to = self.connected_to.copy()
+        return node
 
     __str__ = __repr__
 
@@ -34,27 +80,201 @@ class Connection:
     def __repr__(self):
         return "{} -> {} [w: {}, e: {}, i: {}]".format(self.in_node, self.out_node, self.weight, self.enabled, self.innovation)
 
+    def copy(self):
+        return Connection(self.in_node, self.out_node, self.weight, self.enabled, self.innovation)
+
     __str__ = __repr__
 
+class InnovationRegistry:
+    """
+    Population wide innovation numbers.
+
+    The same (in_node, out_node) connection gets the same innovation number
+    in every genome sharing the registry, which is what lets crossover and
+    speciation line up the genes of two genomes.
+    """
+    def __init__(self):
+        self.innovations = {}
+        self.next_innovation = 0
+
+    def get(self, in_node, out_node):
+        key = (in_node, out_node)
+        innovation = self.innovations.get(key)
+        if innovation is None:
+            innovation = self.next_innovation
+            self.innovations[key] = innovation
+            self.next_innovation += 1
+        return innovation
+
+    def register(self, genomes):
+        """
+        Learns the innovation numbers already used by genomes, e.g. after
+        loading them from disk
+        """
+        for g in genomes:
+            for c in g.connections:
+                self.innovations.setdefault((c.in_node, c.out_node), c.innovation)
+                self.next_innovation = max(self.next_innovation, c.innovation + 1)
+
+# Shared by all genomes that are not given a registry of their own
+default_registry = InnovationRegistry()
+
+
+class CompiledGenome:
+    """
+    Flat evaluation plan of a genome.
+
+    Enabled connections are stored as parallel index/weight lists in
+    evaluation order. Every node is activated once, at its first use as a
+    source, and only activated again if something writes to it after that.
+    For genomes whose connections are in topological order this means
+    exactly one activation per node. The outputs are identical to
+    Genome.eval.
+    """
+    __slots__ = ['num_inputs', 'num_outputs', 'num_nodes', 'src', 'dst', 'weight', 'activate', 'functions']
+
+    def __init__(self, genome):
+        self.num_inputs = genome.num_inputs
+        self.num_outputs = genome.num_outputs
+        self.num_nodes = len(genome.nodes)
+        self.src = []
+        self.dst = []
+        self.weight = []
+        self.activate = []
+        self.functions = [ACTIVATIONS[n.activation] for n in genome.nodes]
+
+        # A node is dirty when its value changed since it was last activated
+        dirty = [True] * self.num_nodes
+        for c in genome.connections:
+            if not c.enabled:
+                continue
+            self.src.append(c.in_node)
+            self.dst.append(c.out_node)
+            self.weight.append(c.weight)
+            self.activate.append(dirty[c.in_node])
+            dirty[c.in_node] = False
+            dirty[c.out_node] = True
+
+    def eval(self, vals):
+        if len(vals) != self.num_inputs:
+            raise ValueError("Invalid number of parameters passed to genome")
+
+        values = [0] * self.num_nodes
+        values[:self.num_inputs] = vals
+        activated = [0] * self.num_nodes
+        functions = self.functions
+        for s, d, w, a in zip(self.src, self.dst, self.weight, self.activate):
+            if a:
+                activated[s] = functions[s](values[s])
+            values[d] += activated[s] * w
+
+        return tuple(values[self.num_inputs: self.num_inputs + self.num_outputs])
+
+
 class Genome:
-    def __init__(self, num_inputs, num_outputs, *, node_mut_rate=0.05, con_mut_rate=0.15):
+    def __init__(self, num_inputs, num_outputs, *, node_mut_rate=0.05, con_mut_rate=0.15, registry=None, activation='sigmoid'):
         self.num_inputs = num_inputs
         self.num_outputs = num_outputs
         self.node_mut_th = node_mut_rate
         self.con_mut_th = con_mut_rate + node_mut_rate
+        # Activation of every node, including the hidden ones added later
+        self.activation = activation
         self.nodes = []
         for _ in range(num_inputs):
-            self.nodes.append(Node(NodeType.INPUT))
+            self.nodes.append(Node(NodeType.INPUT, activation))
         for _ in range(num_outputs):
-            self.nodes.append(Node(NodeType.OUTPUT))
+            self.nodes.append(Node(NodeType.OUTPUT, activation))
         
         self.connections = []
+        # Total size of the connected_to sets, see count_free_connections
+        self.num_connected = 0
         self.cur_innovation = -1
+        self.registry = registry if registry is not None else default_registry
+        self.compiled = None
+        # Connections sorted by innovation, see genes_by_innovation
+        self.sorted_genes = None
+        # See structure_hash
+        self.structure_digest = None
+        # Species of the genome or its parent, set by Speciation
+        self.species_id = -1
+        # Set while the lists are shared with a copy-on-write clone
+        self._shared_nodes = False
+        self._shared_connections = False
+
+    def to_bytes(self):
+        n = len(self.connections)
+        header = GENOME_HEADER.pack(GENOME_MAGIC, self.num_inputs, self.num_outputs,
+            self.node_mut_th, self.con_mut_th, self.cur_innovation, len(self.nodes), n)
+        return b''.join([
+            header,
+            bytes([ACTIVATION_NAMES.index(self.activation)]),
+            bytes(node.tp.value for node in self.nodes),
+            bytes(ACTIVATION_NAMES.index(node.activation) for node in self.nodes),
+            struct.pack('<{}I'.format(n), *[c.in_node for c in self.connections]),
+            struct.pack('<{}I'.format(n), *[c.out_node for c in self.connections]),
+            struct.pack('<{}d'.format(n), *[c.weight for c in self.connections]),
+            bytes(c.enabled for c in self.connections),
+            struct.pack('<{}q'.format(n), *[c.innovation for c in self.connections]),
+        ])
+
+    @staticmethod
+    def from_bytes(data):
+        genome, _ = Genome.unpack_from(data)
+        return genome
+
+    @staticmethod
+    def unpack_from(data, offset=0):
+        """
+        Decodes a genome starting at offset. Returns the genome and the
+        offset right after it.
+        """
+        magic, num_inputs, num_outputs, node_mut_th, con_mut_th, cur_innovation, num_nodes, n = GENOME_HEADER.unpack_from(data, offset)
+        if magic not in (GENOME_MAGIC, GENOME_MAGIC_V1):
+            raise ValueError("Not a genome")
+        offset += GENOME_HEADER.size
+
+        genome = Genome(num_inputs, num_outputs)
+        genome.node_mut_th = node_mut_th
+        genome.con_mut_th = con_mut_th
+        genome.cur_innovation = cur_innovation
+        if magic == GENOME_MAGIC:
+            genome.activation = ACTIVATION_NAMES[data[offset]]
+            offset += 1
+        types = data[offset:offset + num_nodes]
+        offset += num_nodes
+        if magic == GENOME_MAGIC:
+            activations = [ACTIVATION_NAMES[a] for a in data[offset:offset + num_nodes]]
+            offset += num_nodes
+        else:
+            activations = ['sigmoid'] * num_nodes
+        genome.nodes = [Node(NodeType(tp), a) for tp, a in zip(types, activations)]
+
+        in_nodes = struct.unpack_from('<{}I'.format(n), data, offset)
+        offset += 4 * n
+        out_nodes = struct.unpack_from('<{}I'.format(n), data, offset)
+        offset += 4 * n
+        weights = struct.unpack_from('<{}d'.format(n), data, offset)
+        offset += 8 * n
+        enabled = data[offset:offset + n]
+        offset += n
+        innovations = struct.unpack_from('<{}q'.format(n), data, offset)
+        offset += 8 * n
+
+        for c in zip(in_nodes, out_nodes, weights, enabled, innovations):
+            conn = Connection(c[0], c[1], c[2], bool(c[3]), c[4])
+            genome.connections.append(conn)
+            genome._connect(conn.in_node, conn.out_node)
+
+        return genome, offset
 
     def save(self, file_name):
-        pass
+        with open(file_name, 'wb') as f:
+            f.write(self.to_bytes())
+
     def load(self, file_name):
-        pass
+        with open(file_name, 'rb') as f:
+            loaded = Genome.from_bytes(f.read())
+        self.__dict__.update(loaded.__dict__)
 
     def __repr__(self):
         base_str = "Nodes: {}, Connections: {}".format(len(self.nodes), len(self.connections))
@@ -64,9 +284,38 @@ class Genome:
 
     __str__ = __repr__
 
-    def get_innovation(self):
-        # self.cur_innovation += 1
-        return self.cur_innovation
+    def get_innovation(self, in_node, out_node):
+        return self.registry.get(in_node, out_node)
+
+    def changed(self):
+        """
+        Drops everything derived from the genes, called by every mutation
+        """
+        self.compiled = None
+        self.sorted_genes = None
+        self.structure_digest = None
+
+    def structure_hash(self):
+        """
+        Stable hex digest of everything eval depends on: the node types and
+        activations and the connections in gene order. Unlike to_bytes it
+        leaves out innovation numbers and mutation rates, so equal networks
+        bred along different lines hash the same.
+        """
+        if self.structure_digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(struct.pack('<II', self.num_inputs, self.num_outputs))
+            h.update(bytes(node.tp.value for node in self.nodes))
+            h.update(bytes(ACTIVATION_NAMES.index(node.activation) for node in self.nodes))
+            for c in self.connections:
+                h.update(STRUCTURE_CONNECTION.pack(c.in_node, c.out_node, c.weight, c.enabled))
+            self.structure_digest = h.hexdigest()
+        return self.structure_digest
+
+    def genes_by_innovation(self):
+        if self.sorted_genes is None:
+            self.sorted_genes = sorted(self.connections, key=lambda c: c.innovation)
+        return self.sorted_genes
 
     def random_enabled_connection(self, max_tries):
         if len(self.connections) == 0:
@@ -82,35 +331,140 @@ class Genome:
 
         return conn
 
+    def clone(self, *, copy_on_write=False):
+        """
+        Fast replacement for copy.deepcopy of a genome.
+
+        With copy_on_write the clone shares its nodes and connections with
+        self. The first mutation on either side copies what it is about to
+        change. A weight mutation only copies the connections, so offspring
+        that only get one never copy their nodes.
+        """
+        child = Genome.__new__(Genome)
+        child.__dict__.update(self.__dict__)
+        child.sorted_genes = None
+        if copy_on_write:
+            self._shared_nodes = child._shared_nodes = True
+            self._shared_connections = child._shared_connections = True
+        else:
+            child.nodes = [n.copy() for n in self.nodes]
+            child.connections = [c.copy() for c in self.connections]
+            child._shared_nodes = False
+            child._shared_connections = False
+        return child
+
+    def __deepcopy__(self, memo):
+        # The innovation registry is population wide, so copies share it
+        # instead of starting a private one that hands out other numbers
+        memo[id(self.registry)] = self.registry
+        child = Genome.__new__(Genome)
+        memo[id(self)] = child
+        child.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        child._shared_nodes = False
+        child._shared_connections = False
+        return child
+
+    def _own_nodes(self):
+        if self._shared_nodes:
+            self.nodes = [n.copy() for n in self.nodes]
+            self._shared_nodes = False
+
+    def _own_connection(self, conn):
+        """
+        Makes sure the connections are not shared with a clone and returns
+        the private copy of conn
+        """
+        if not self._shared_connections:
+            return conn
+        i = self.connections.index(conn)
+        self.connections = [c.copy() for c in self.connections]
+        self._shared_connections = False
+        return self.connections[i]
+
+    def compile(self):
+        """
+        Returns the flat evaluation plan of the genome, building it if the
+        genome changed since the last call.
+        """
+        if self.compiled is None:
+            self.compiled = CompiledGenome(self)
+        return self.compiled
+
     def add_node(self, max_tries=4):
         conn = self.random_enabled_connection(max_tries)
         if conn is None:
             return False
+        self._own_nodes()
+        conn = self._own_connection(conn)
+        self.changed()
         conn.enabled = False
-        new_node = Node(NodeType.HIDDEN)
+        new_node = Node(NodeType.HIDDEN, self.activation)
         self.nodes.append(new_node)
         new_node_id = len(self.nodes) - 1
-        self.connections.append(Connection(conn.in_node, new_node_id, 1, True, self.get_innovation()))
-        self.connections.append(Connection(new_node_id, conn.out_node, conn.weight, True, self.get_innovation()))
-        new_node.connected_to.add(conn.out_node)
-        self.nodes[conn.in_node].connected_to.add(new_node_id)
+        self.connections.append(Connection(conn.in_node, new_node_id, 1, True, self.get_innovation(conn.in_node, new_node_id)))
+        self.connections.append(Connection(new_node_id, conn.out_node, conn.weight, True, self.get_innovation(new_node_id, conn.out_node)))
+        self._connect(new_node_id, conn.out_node)
+        self._connect(conn.in_node, new_node_id)
 
         return True
 
+    def _connect(self, in_node, out_node):
+        """
+        Marks the (in_node, out_node) pair as used. Everything that adds to
+        connected_to goes through here to keep num_connected up to date.
+        """
+        connected_to = self.nodes[in_node].connected_to
+        if out_node not in connected_to:
+            connected_to.add(out_node)
+            self.num_connected += 1
+
+    def count_free_connections(self):
+        """
+        Returns the number of (in, out) pairs add_connection can still pick
+        from and the total number of pairs, in constant time
+        """
+        num_targets = len(self.nodes) - self.num_inputs
+        # Every node may connect to every non-input node except itself
+        num_pairs = len(self.nodes) * num_targets - num_targets
+        return num_pairs - self.num_connected, num_pairs
+
     def add_connection(self):
-        possible_connections = []
-        for i in range(len(self.nodes)):
-            others = set(range(self.num_inputs, len(self.nodes)))
-            for o in (others - self.nodes[i].connected_to):
-                if o == i:
-                    continue
-                possible_connections.append((i, o))
-
-        if len(possible_connections) == 0:
+        num_free, num_pairs = self.count_free_connections()
+        if num_free <= 0:
             return False
-        (in_node, out_node) = random.choice(possible_connections)
-        self.connections.append(Connection(in_node, out_node, random.random() * 2 - 1, True, self.get_innovation()))
-        self.nodes[in_node].connected_to.add(out_node)
+
+        num_nodes = len(self.nodes)
+        if 4 * num_free >= num_pairs:
+            # Rejection sampling over all pairs is uniform over the free ones
+            # and needs fewer than 4 tries on average at this density
+            while True:
+                in_node = random.randrange(num_nodes)
+                out_node = random.randrange(self.num_inputs, num_nodes)
+                if out_node != in_node and out_node not in self.nodes[in_node].connected_to:
+                    break
+        else:
+            # Nearly fully connected. Pick the k-th free pair by skipping
+            # whole nodes by their free counts, then walk the targets of the
+            # node it falls in, linear in the number of nodes
+            num_targets = num_nodes - self.num_inputs
+            k = random.randrange(num_free)
+            for in_node, node in enumerate(self.nodes):
+                free = num_targets - len(node.connected_to) - (in_node >= self.num_inputs)
+                if k < free:
+                    break
+                k -= free
+            for out_node in range(self.num_inputs, num_nodes):
+                if out_node != in_node and out_node not in node.connected_to:
+                    if k == 0:
+                        break
+                    k -= 1
+        self._own_nodes()
+        if self._shared_connections:
+            self.connections = [c.copy() for c in self.connections]
+            self._shared_connections = False
+        self.changed()
+        self.connections.append(Connection(in_node, out_node, random.random() * 2 - 1, True, self.get_innovation(in_node, out_node)))
+        self._connect(in_node, out_node)
         return True
 
     def modify_weight(self, max_tries=4):
@@ -118,9 +472,11 @@ class Genome:
         if conn is None:
             return False
 
+        conn = self._own_connection(conn)
         new_weight = random.random() * 2 - 1
         mix_param = random.random() / 2 # [0, 0.5)
         conn.weight = mix_param * conn.weight + (1 - mix_param) * new_weight
+        self.changed()
         return True
 
     def mutate(self):
@@ -138,29 +494,40 @@ class Genome:
 
 
     def mate(self, other):
+        """
+        Crossover with self as the fitter parent. The genes of both parents
+        are lined up by innovation number in one linear merge. Matching genes
+        are inherited from either parent at random, disjoint and excess ones
+        only from self. A gene disabled in either parent stays disabled with
+        a 75% chance. The child keeps the structure and gene order of self.
+        """
         if self.__class__ != other.__class__:
             raise ValueError("Interspecies mating is prohibited!")
+        if self.num_inputs != other.num_inputs or self.num_outputs != other.num_outputs:
+            raise ValueError("Genomes have different inputs or outputs")
 
-        child = Genome(self.num_inputs, self.num_outputs)
-        num_hidden = max(len(self.nodes), len(other.nodes)) - (self.num_inputs + self.num_outputs)
-        for _ in range(num_hidden):
-            child.nodes.append(Node(NodeType.HIDDEN))
-        
-        gene_dict_a = {conn.inovation: conn for conn in self.connections}
-        gene_dict_b = {conn.inovation: conn for conn in other.connections}
-
-        all_keys = set(gene_dict_a.keys()) + set(gene_dict_b.keys())
-
-        for k in all_keys:
-            if k in gene_dict_a and k in gene_dict_b:
-                child.connections.append(random.choice([gene_dict_a[k], gene_dict_b[k]]))
-            elif k in gene_dict_a:
-                child.connections.append(gene_dict_a[k])
+        inherited = {}
+        for a, b in align_genes(self, other):
+            if a is None:
+                continue
+            if b is None:
+                weight, enabled = a.weight, a.enabled
             else:
-                child.connections.append(gene_dict_b[k])
+                weight = a.weight if random.random() < 0.5 else b.weight
+                enabled = True
+                if not a.enabled or not b.enabled:
+                    enabled = random.random() >= 0.75
+            inherited[id(a)] = Connection(a.in_node, a.out_node, weight, enabled, a.innovation)
 
+        child = Genome(self.num_inputs, self.num_outputs, registry=self.registry, activation=self.activation)
+        child.species_id = self.species_id
+        child.node_mut_th = self.node_mut_th
+        child.con_mut_th = self.con_mut_th
+        child.cur_innovation = max(self.cur_innovation, other.cur_innovation)
+        child.nodes = [Node(n.tp, n.activation) for n in self.nodes]
+        child.connections = [inherited[id(c)] for c in self.connections]
         for c in child.connections:
-            child.nodes[c.in_node].add(c.out_node)
+            child._connect(c.in_node, c.out_node)
 
         return child
 
@@ -182,4 +549,699 @@ class Genome:
                 continue
             self.nodes[c.out_node].value += self.nodes[c.in_node].activate() * c.weight
 
-        return tuple([n.value for n in self.nodes[self.num_inputs: self.num_inputs + self.num_outputs]])
\ No newline at end of file
+        return tuple([n.value for n in self.nodes[self.num_inputs: self.num_inputs + self.num_outputs]])
+
+
+def align_genes(a, b):
+    """
+    Merges the genes of two genomes in innovation order. Yields
+    (gene_a, gene_b) pairs, with None on the side missing a gene.
+    """
+    genes_a = a.genes_by_innovation()
+    genes_b = b.genes_by_innovation()
+    i = j = 0
+    while i < len(genes_a) and j < len(genes_b):
+        ga, gb = genes_a[i], genes_b[j]
+        if ga.innovation == gb.innovation:
+            yield ga, gb
+            i += 1
+            j += 1
+        elif ga.innovation < gb.innovation:
+            yield ga, None
+            i += 1
+        else:
+            yield None, gb
+            j += 1
+    for ga in genes_a[i:]:
+        yield ga, None
+    for gb in genes_b[j:]:
+        yield None, gb
+
+def compatibility_distance(a, b, *, excess_coef=1.0, disjoint_coef=1.0, weight_coef=0.4):
+    """
+    NEAT compatibility distance, computed in one merge over the genes of
+    both genomes sorted by innovation. Genes past the last innovation of
+    the other genome are excess, other unmatched genes are disjoint.
+    """
+    genes_a = a.genes_by_innovation()
+    genes_b = b.genes_by_innovation()
+    if len(genes_a) == 0 and len(genes_b) == 0:
+        return 0.0
+    last_a = genes_a[-1].innovation if len(genes_a) > 0 else -1
+    last_b = genes_b[-1].innovation if len(genes_b) > 0 else -1
+
+    excess = 0
+    disjoint = 0
+    matching = 0
+    weight_diff = 0.0
+    for ga, gb in align_genes(a, b):
+        if ga is not None and gb is not None:
+            matching += 1
+            weight_diff += abs(ga.weight - gb.weight)
+        elif ga is not None:
+            if ga.innovation > last_b:
+                excess += 1
+            else:
+                disjoint += 1
+        else:
+            if gb.innovation > last_a:
+                excess += 1
+            else:
+                disjoint += 1
+
+    # Small genomes are not normalized, as in the NEAT paper. Larger ones
+    # are normalized per 20 genes rather than per gene, so distances do
+    # not drop twentyfold the moment a genome grows its 20th gene.
+    size = max(len(genes_a), len(genes_b), 20) / 20
+    distance = (excess_coef * excess + disjoint_coef * disjoint) / size
+    if matching > 0:
+        distance += weight_coef * weight_diff / matching
+    return distance
+
+
+class Species:
+    def __init__(self, species_id, representative):
+        self.id = species_id
+        self.representative = representative
+        self.members = []
+        # Best fitness any member reached and generations since it improved
+        self.best_fitness = -math.inf
+        self.stagnant = 0
+
+    def __repr__(self):
+        return "Species {}: {} members".format(self.id, len(self.members))
+
+    __str__ = __repr__
+
+
+class Speciation:
+    """
+    Splits a population into species by compatibility distance and breeds
+    the next generation with explicit fitness sharing.
+
+    Species and their representatives carry over from one generation to
+    the next. Every genome joins the oldest species whose representative
+    is within the threshold, so a genome needs at most one distance
+    computation per species. The new representative of a species is its
+    member closest to the old one, so species drift slowly instead of
+    jumping to an arbitrary member. A species whose best fitness has not
+    improved for max_stagnation generations gets no more offspring, unless
+    it holds the best genome, and dies out.
+
+    If target_species is set, the threshold is scaled after every
+    generation to steer towards that many species, by up to threshold_step
+    of its value in proportion to how far off the species count is. The
+    step shrinks while the direction keeps flipping and grows back while
+    it does not, so the threshold settles without getting stuck when
+    distances change scale, e.g. once genomes are large enough to be
+    normalized by their size.
+    """
+    def __init__(self, threshold=3.0, *, excess_coef=1.0, disjoint_coef=1.0, weight_coef=0.4, survival_rate=0.5,
+                 target_species=None, threshold_step=0.3, max_stagnation=15):
+        self.threshold = threshold
+        self.target_species = target_species
+        self.threshold_step = threshold_step
+        self.step = threshold_step
+        self.last_direction = 0
+        self.max_stagnation = max_stagnation
+        self.excess_coef = excess_coef
+        self.disjoint_coef = disjoint_coef
+        self.weight_coef = weight_coef
+        self.survival_rate = survival_rate
+        self.species = []
+        self.next_id = 0
+
+    def distance(self, a, b):
+        return compatibility_distance(a, b, excess_coef=self.excess_coef,
+            disjoint_coef=self.disjoint_coef, weight_coef=self.weight_coef)
+
+    def find_species(self, genome):
+        """
+        Returns the species genome belongs to and its distance to the
+        representative, or (None, None)
+        """
+        for s in self.species:
+            d = self.distance(genome, s.representative)
+            if d < self.threshold:
+                return s, d
+        return None, None
+
+    def speciate(self, genomes):
+        """
+        Assigns the genomes to species, creating new species as needed, and
+        returns the species that have members
+        """
+        for s in self.species:
+            s.members = []
+
+        # Species id -> (distance, member) of the member closest to the old
+        # representative
+        closest = {}
+        for g in genomes:
+            s, d = self.find_species(g)
+            if s is None:
+                s = Species(self.next_id, g)
+                self.next_id += 1
+                self.species.append(s)
+                d = 0.0
+            s.members.append(g)
+            g.species_id = s.id
+            if s.id not in closest or d < closest[s.id][0]:
+                closest[s.id] = (d, g)
+
+        self.species = [s for s in self.species if len(s.members) > 0]
+        for s in self.species:
+            s.representative = closest[s.id][1]
+
+        if self.target_species is not None:
+            error = (len(self.species) - self.target_species) / self.target_species
+            direction = (error > 0) - (error < 0)
+            if direction != 0:
+                if direction == -self.last_direction:
+                    self.step = max(self.step / 2, self.threshold_step / 16)
+                elif direction == self.last_direction:
+                    self.step = min(self.step * 1.5, self.threshold_step)
+                self.last_direction = direction
+            self.threshold *= 1 + self.step * max(-1.0, min(error, 1.0))
+        return self.species
+
+    def update_stagnation(self, fitness):
+        for s in self.species:
+            best = max(fitness(g) for g in s.members)
+            if best > s.best_fitness:
+                s.best_fitness = best
+                s.stagnant = 0
+            else:
+                s.stagnant += 1
+
+    def allot_offspring(self, total, fitness):
+        """
+        Splits total offspring between the species that are not stagnant.
+        Every one of them gets one, its champion, so new species are not
+        wiped out before they had a chance to improve. The rest is split in
+        proportion to how far the average fitness of a species is above the
+        worst one. If there are more species than offspring, only the best
+        species get one.
+        """
+        top = max(range(len(self.species)), key=lambda i: max(fitness(g) for g in self.species[i].members))
+        alive = [i for i, s in enumerate(self.species) if s.stagnant < self.max_stagnation or i == top]
+        quotas = [0] * len(self.species)
+        for i, quota in zip(alive, self._split(total, [self.species[i] for i in alive], fitness)):
+            quotas[i] = quota
+        return quotas
+
+    def _split(self, total, species, fitness):
+        averages = [sum(fitness(g) for g in s.members) / len(s.members) for s in species]
+        if total < len(averages):
+            best = sorted(range(len(averages)), key=lambda i: averages[i], reverse=True)[:total]
+            return [1 if i in best else 0 for i in range(len(averages))]
+
+        lowest = min(averages)
+        shares = [a - lowest for a in averages]
+        share_sum = sum(shares)
+        rest = total - len(averages)
+        if share_sum > 0:
+            exact = [1 + rest * sh / share_sum for sh in shares]
+        else:
+            exact = [1 + rest / len(shares) for _ in shares]
+        quotas = [int(e) for e in exact]
+        # Largest remainders get the offspring lost to rounding down
+        by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - quotas[i], reverse=True)
+        for i in by_remainder[:total - sum(quotas)]:
+            quotas[i] += 1
+        return quotas
+
+    def state(self):
+        """
+        What speciate carries over from one generation to the next, as
+        plain data for checkpoints
+        """
+        return {
+            'threshold': self.threshold,
+            'step': self.step,
+            'last_direction': self.last_direction,
+            'next_id': self.next_id,
+            'species_ids': [s.id for s in self.species],
+            'stagnation': [(s.best_fitness, s.stagnant) for s in self.species],
+            'representatives': population_to_bytes([s.representative for s in self.species]),
+        }
+
+    def restore(self, state):
+        self.threshold = state['threshold']
+        self.step = state.get('step', self.threshold_step)
+        self.last_direction = state.get('last_direction', 0)
+        self.next_id = state['next_id']
+        representatives = population_from_bytes(state['representatives'])
+        self.species = [Species(i, r) for i, r in zip(state['species_ids'], representatives)]
+        for s, (best_fitness, stagnant) in zip(self.species, state.get('stagnation', [])):
+            s.best_fitness = best_fitness
+            s.stagnant = stagnant
+
+    def breed(self, genomes, total, fitness, *, crossover_rate=0.25):
+        """
+        Speciates the genomes and breeds total offspring from them. Each
+        species keeps its champion unchanged; the rest of its offspring are
+        mutated clones or crossovers of its fittest members.
+        """
+        self.speciate(genomes)
+        self.update_stagnation(fitness)
+        offspring = []
+        for s, quota in zip(self.species, self.allot_offspring(total, fitness)):
+            if quota == 0:
+                continue
+            members = sorted(s.members, key=fitness, reverse=True)
+            parents = members[:max(1, int(len(members) * self.survival_rate))]
+            offspring.append(members[0].clone(copy_on_write=True))
+            for _ in range(quota - 1):
+                if len(parents) > 1 and random.random() < crossover_rate:
+                    a, b = random.sample(parents, 2)
+                    if fitness(b) > fitness(a):
+                        a, b = b, a
+                    child = a.mate(b)
+                else:
+                    child = random.choice(parents).clone(copy_on_write=True)
+                child.mutate()
+                offspring.append(child)
+        return offspring
+
+
+def population_to_bytes(genomes):
+    return struct.pack('<I', len(genomes)) + b''.join(g.to_bytes() for g in genomes)
+
+def population_from_bytes(data):
+    (count,) = struct.unpack_from('<I', data)
+    offset = 4
+    genomes = []
+    for _ in range(count):
+        genome, offset = Genome.unpack_from(data, offset)
+        genomes.append(genome)
+    return genomes
+
+def save_population(file_name, genomes):
+    with open(file_name, 'wb') as f:
+        f.write(population_to_bytes(genomes))
+
+def load_population(file_name):
+    with open(file_name, 'rb') as f:
+        return population_from_bytes(f.read())
+
+def random_genome(mutations, *, num_inputs=7, num_outputs=2, node_mut_rate=0.3, con_mut_rate=0.4, registry=None, activation='sigmoid'):
+    """
+    Genome grown by mutations random mutations, for tests and benchmarks.
+    Uses the global random state, so seed it first for repeatable genomes.
+    """
+    g = Genome(num_inputs, num_outputs, node_mut_rate=node_mut_rate, con_mut_rate=con_mut_rate, registry=registry, activation=activation)
+    for _ in range(mutations):
+        g.mutate()
+    return g
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class CompiledGenomeTest(unittest.TestCase):
+    def test_matches_eval(self):
+        random.seed(1234)
+        for _ in range(50):
+            g = random_genome(random.randint(0, 60))
+            plan = g.compile()
+            for _ in range(10):
+                vals = [random.uniform(-2, 2) for _ in range(7)]
+                self.assertEqual(plan.eval(vals), g.eval(vals))
+
+    def test_recompiled_after_mutation(self):
+        random.seed(42)
+        g = random_genome(5)
+        plan = g.compile()
+        self.assertIs(g.compile(), plan)
+        g.mutate()
+        self.assertIsNot(g.compile(), plan)
+
+    def test_one_activation_per_node_when_ordered(self):
+        g = Genome(2, 1)
+        g.connections.append(Connection(0, 2, 0.5, True, 0))
+        g.connections.append(Connection(1, 2, 0.5, True, 0))
+        g.connections.append(Connection(0, 2, 0.5, False, 0))
+        plan = g.compile()
+        self.assertEqual(plan.activate, [True, True])
+        self.assertEqual(plan.eval([1, 2]), g.eval([1, 2]))
+
+
+class SerializationTest(unittest.TestCase):
+    def assertSameGenome(self, a, b):
+        self.assertEqual([n.tp for n in a.nodes], [n.tp for n in b.nodes])
+        self.assertEqual(
+            [(c.in_node, c.out_node, c.weight, c.enabled, c.innovation) for c in a.connections],
+            [(c.in_node, c.out_node, c.weight, c.enabled, c.innovation) for c in b.connections])
+        self.assertEqual([n.connected_to for n in a.nodes], [n.connected_to for n in b.nodes])
+        self.assertEqual((a.node_mut_th, a.con_mut_th, a.cur_innovation), (b.node_mut_th, b.con_mut_th, b.cur_innovation))
+        for _ in range(10):
+            vals = [random.uniform(-2, 2) for _ in range(7)]
+            self.assertEqual(a.eval(vals), b.eval(vals))
+
+    def test_round_trip(self):
+        random.seed(99)
+        for _ in range(30):
+            g = random_genome(random.randint(0, 60))
+            self.assertSameGenome(g, Genome.from_bytes(g.to_bytes()))
+
+    def test_population_round_trip(self):
+        random.seed(100)
+        genomes = [random_genome(random.randint(0, 30)) for _ in range(20)]
+        loaded = population_from_bytes(population_to_bytes(genomes))
+        self.assertEqual(len(loaded), len(genomes))
+        for a, b in zip(genomes, loaded):
+            self.assertSameGenome(a, b)
+
+    def test_save_load(self):
+        import os
+        import tempfile
+        random.seed(101)
+        g = random_genome(40)
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'genome.bin')
+            g.save(file_name)
+            loaded = Genome(7, 2)
+            loaded.load(file_name)
+        self.assertSameGenome(g, loaded)
+
+
+class CloneTest(unittest.TestCase):
+    def snapshot(self, g):
+        return g.to_bytes(), [set(n.connected_to) for n in g.nodes]
+
+    def test_clone_is_independent(self):
+        random.seed(5)
+        for copy_on_write in (False, True):
+            for _ in range(30):
+                parent = random_genome(random.randint(0, 40))
+                before = self.snapshot(parent)
+                child = parent.clone(copy_on_write=copy_on_write)
+                self.assertEqual(self.snapshot(child), before)
+                for _ in range(5):
+                    child.mutate()
+                self.assertEqual(self.snapshot(parent), before)
+
+                # Mutating the parent must not leak into a shared clone either
+                child = parent.clone(copy_on_write=copy_on_write)
+                child_before = self.snapshot(child)
+                for _ in range(5):
+                    parent.mutate()
+                self.assertEqual(self.snapshot(child), child_before)
+
+    def test_weight_mutation_keeps_nodes_shared(self):
+        random.seed(6)
+        parent = Genome(7, 2)
+        for _ in range(20):
+            parent.add_connection()
+        child = parent.clone(copy_on_write=True)
+        self.assertTrue(child.modify_weight())
+        self.assertIs(child.nodes, parent.nodes)
+        self.assertIsNot(child.connections, parent.connections)
+
+    def test_matches_deepcopy(self):
+        random.seed(7)
+        g = random_genome(40)
+        state = random.getstate()
+        a = copy.deepcopy(g)
+        self.assertIs(a.registry, g.registry)
+        a.mutate()
+        random.setstate(state)
+        b = g.clone(copy_on_write=True)
+        b.mutate()
+        self.assertEqual(self.snapshot(a), self.snapshot(b))
+
+
+class AddConnectionTest(unittest.TestCase):
+    def free_pairs(self, g):
+        return {(i, o) for i in range(len(g.nodes)) for o in range(g.num_inputs, len(g.nodes))
+                if o != i and o not in g.nodes[i].connected_to}
+
+    def check_uniform(self, g, samples):
+        free = self.free_pairs(g)
+        self.assertEqual(g.count_free_connections()[0], len(free))
+        counts = dict.fromkeys(free, 0)
+        for _ in range(samples):
+            child = g.clone()
+            child.add_connection()
+            c = child.connections[-1]
+            counts[(c.in_node, c.out_node)] += 1
+        expected = samples / len(free)
+        for pair, count in counts.items():
+            self.assertLess(abs(count - expected), 5 * math.sqrt(expected), pair)
+
+    def test_uniform_sparse(self):
+        random.seed(8)
+        g = Genome(3, 2)
+        g.add_connection()
+        g.add_connection()
+        self.check_uniform(g, 20000)
+
+    def test_uniform_dense(self):
+        random.seed(9)
+        g = Genome(3, 2)
+        g.add_connection()
+        g.add_node()
+        num_free, num_pairs = g.count_free_connections()
+        while 4 * num_free >= num_pairs:
+            g.add_connection()
+            num_free, num_pairs = g.count_free_connections()
+        self.assertGreater(num_free, 1)
+        self.check_uniform(g, 5000)
+
+    def test_full(self):
+        g = Genome(2, 1)
+        self.assertTrue(g.add_connection())
+        self.assertTrue(g.add_connection())
+        self.assertFalse(g.add_connection())
+
+    def test_count_maintained(self):
+        random.seed(10)
+        registry = InnovationRegistry()
+        genomes = [random_genome(random.randint(0, 40), registry=registry) for _ in range(20)]
+        for _ in range(200):
+            a, b = random.sample(genomes, 2)
+            g = random.choice([a.clone(copy_on_write=True), a.mate(b), Genome.from_bytes(a.to_bytes())])
+            for _ in range(random.randint(1, 5)):
+                g.mutate()
+            self.assertEqual(g.count_free_connections()[0], len(self.free_pairs(g)))
+            genomes[random.randrange(len(genomes))] = g
+
+
+class StructureHashTest(unittest.TestCase):
+    def test_hash(self):
+        random.seed(18)
+        g = random_genome(30)
+        digest = g.structure_hash()
+        self.assertEqual(Genome.from_bytes(g.to_bytes()).structure_hash(), digest)
+
+        clone = g.clone(copy_on_write=True)
+        self.assertEqual(clone.structure_hash(), digest)
+        clone.cur_innovation += 100
+        clone.node_mut_th = 0.5
+        self.assertEqual(Genome.from_bytes(clone.to_bytes()).structure_hash(), digest)
+
+        clone.modify_weight()
+        self.assertNotEqual(clone.structure_hash(), digest)
+        self.assertEqual(g.structure_hash(), digest)
+
+
+class CrossoverTest(unittest.TestCase):
+    def test_registry_shared(self):
+        registry = InnovationRegistry()
+        a = Genome(3, 2, registry=registry)
+        b = Genome(3, 2, registry=registry)
+        self.assertEqual(a.get_innovation(0, 3), b.get_innovation(0, 3))
+        self.assertNotEqual(a.get_innovation(0, 3), a.get_innovation(1, 3))
+
+        a.connections.append(Connection(0, 3, 1, True, registry.get(0, 3)))
+        other = InnovationRegistry()
+        other.register([a])
+        self.assertEqual(other.get(0, 3), registry.get(0, 3))
+        self.assertEqual(other.get(2, 4), 1)
+
+    def test_align(self):
+        registry = InnovationRegistry()
+        a = Genome(2, 2, registry=registry)
+        b = Genome(2, 2, registry=registry)
+        for in_node, out_node in [(0, 2), (1, 3), (0, 3)]:
+            a.connections.append(Connection(in_node, out_node, 1, True, registry.get(in_node, out_node)))
+        for in_node, out_node in [(1, 2), (0, 3), (0, 2)]:
+            b.connections.append(Connection(in_node, out_node, 1, True, registry.get(in_node, out_node)))
+        pairs = [(ga and ga.innovation, gb and gb.innovation) for ga, gb in align_genes(a, b)]
+        self.assertEqual(pairs, [(0, 0), (1, None), (2, 2), (None, 3)])
+
+    def test_mate(self):
+        random.seed(12)
+        registry = InnovationRegistry()
+        ancestor = random_genome(10, registry=registry)
+        for _ in range(20):
+            a = ancestor.clone()
+            b = ancestor.clone()
+            for _ in range(random.randint(0, 20)):
+                a.mutate()
+            for _ in range(random.randint(0, 20)):
+                b.mutate()
+
+            child = a.mate(b)
+            self.assertEqual([(c.in_node, c.out_node, c.innovation) for c in child.connections],
+                             [(c.in_node, c.out_node, c.innovation) for c in a.connections])
+            self.assertEqual([n.tp for n in child.nodes], [n.tp for n in a.nodes])
+            self.assertEqual([n.connected_to for n in child.nodes], [n.connected_to for n in a.nodes])
+            weights_b = {c.innovation: c.weight for c in b.connections}
+            for c, ca in zip(child.connections, a.connections):
+                self.assertIn(c.weight, (ca.weight, weights_b.get(c.innovation)))
+                self.assertIsNot(c, ca)
+            child.mutate()
+            child.eval([0.5] * 7)
+
+    def test_mate_rejects_other_shapes(self):
+        with self.assertRaises(ValueError):
+            Genome(7, 2).mate(Genome(3, 2))
+
+
+class SpeciationTest(unittest.TestCase):
+    def make_genome(self, registry, pairs, weight=0.5):
+        g = Genome(3, 2, registry=registry)
+        for in_node, out_node in pairs:
+            g.connections.append(Connection(in_node, out_node, weight, True, registry.get(in_node, out_node)))
+            g._connect(in_node, out_node)
+        return g
+
+    def test_distance(self):
+        registry = InnovationRegistry()
+        a = self.make_genome(registry, [(0, 3), (1, 3), (2, 4)])
+        b = self.make_genome(registry, [(0, 3), (2, 4), (0, 4), (1, 4)], weight=0.25)
+        # innovations: a = 0 1 2, b = 0 2 3 4 -> 1 disjoint, 2 excess, 2 matching
+        self.assertAlmostEqual(compatibility_distance(a, b), 1 + 2 + 0.4 * 0.25)
+        self.assertAlmostEqual(compatibility_distance(b, a), 1 + 2 + 0.4 * 0.25)
+        self.assertEqual(compatibility_distance(a, a), 0)
+
+    def test_speciate(self):
+        random.seed(13)
+        registry = InnovationRegistry()
+        near = [self.make_genome(registry, [(0, 3), (1, 3)], weight=w) for w in (0.1, 0.2, 0.3)]
+        far = [self.make_genome(registry, [(2, 4), (0, 4), (1, 4), (2, 3)]) for _ in range(2)]
+        speciation = Speciation(threshold=2.0)
+        species = speciation.speciate(near + far)
+        self.assertEqual(sorted(len(s.members) for s in species), [2, 3])
+        self.assertEqual(len({g.species_id for g in near}), 1)
+        self.assertEqual(len({g.species_id for g in far}), 1)
+
+        # Species persist across generations
+        ids = {s.id for s in species}
+        children = [g.clone() for g in near + far]
+        self.assertEqual({s.id for s in speciation.speciate(children)}, ids)
+
+    def test_breed(self):
+        random.seed(14)
+        registry = InnovationRegistry()
+        population = [random_genome(random.randint(1, 30), registry=registry) for _ in range(60)]
+        fitness = {id(g): random.uniform(-1000, 0) for g in population}
+        speciation = Speciation()
+        offspring = speciation.breed(population, 60, lambda g: fitness[id(g)])
+        self.assertEqual(len(offspring), 60)
+        self.assertGreater(len(speciation.species), 1)
+
+    def test_target_species(self):
+        random.seed(15)
+        registry = InnovationRegistry()
+        population = []
+        for _ in range(4):
+            ancestor = random_genome(20, registry=registry)
+            for _ in range(25):
+                g = ancestor.clone()
+                for _ in range(random.randint(0, 3)):
+                    g.mutate()
+                population.append(g)
+        speciation = Speciation(threshold=0.5, target_species=4)
+        counts = [len(speciation.speciate(population)) for _ in range(30)]
+        self.assertGreater(counts[0], 4)
+        self.assertLessEqual(abs(counts[-1] - 4), 2)
+
+    def test_target_species_over_generations(self):
+        random.seed(20)
+        registry = InnovationRegistry()
+        population = [random_genome(random.randint(1, 10), registry=registry) for _ in range(100)]
+        speciation = Speciation(target_species=8)
+        counts = []
+        for _ in range(60):
+            fitness = {id(g): sum(c.weight for c in g.connections if c.enabled) + random.random() for g in population}
+            population = speciation.breed(population, 100, lambda g: fitness[id(g)])
+            counts.append(len(speciation.species))
+        settled = counts[15:]
+        self.assertTrue(all(4 <= c <= 16 for c in settled), counts)
+        self.assertLess(abs(sum(settled) / len(settled) - 8), 2, counts)
+
+    def test_stagnant_species_die_out(self):
+        speciation = Speciation(max_stagnation=2)
+        speciation.species = [Species(0, None), Species(1, None)]
+        speciation.species[0].members = [-10, -12]
+        speciation.species[1].members = [-1000]
+        for _ in range(3):
+            speciation.update_stagnation(lambda f: f)
+        self.assertEqual(speciation.allot_offspring(10, lambda f: f), [10, 0])
+
+    def test_allot_offspring(self):
+        speciation = Speciation()
+        speciation.species = [Species(0, None), Species(1, None)]
+        speciation.species[0].members = [-10, -12]
+        speciation.species[1].members = [-1000]
+        self.assertEqual(speciation.allot_offspring(10, lambda f: f), [9, 1])
+        self.assertEqual(speciation.allot_offspring(1, lambda f: f), [1, 0])
+
+        speciation.species.append(Species(2, None))
+        speciation.species[2].members = [-500]
+        # 7 left after one each, split 989 : 0 : 500
+        self.assertEqual(speciation.allot_offspring(10, lambda f: f), [6, 1, 3])
+
+    def test_state_round_trip(self):
+        random.seed(19)
+        registry = InnovationRegistry()
+        population = [random_genome(random.randint(1, 30), registry=registry) for _ in range(40)]
+        speciation = Speciation(target_species=3)
+        speciation.speciate(population)
+        restored = Speciation(target_species=3)
+        restored.restore(speciation.state())
+        self.assertEqual(restored.threshold, speciation.threshold)
+        self.assertEqual(restored.next_id, speciation.next_id)
+        self.assertEqual([s.id for s in restored.species], [s.id for s in speciation.species])
+        self.assertEqual([s.representative.to_bytes() for s in restored.species],
+                         [s.representative.to_bytes() for s in speciation.species])
+
+
+class ActivationTest(unittest.TestCase):
+    def test_activations_in_eval(self):
+        random.seed(16)
+        for name in ACTIVATION_NAMES:
+            g = random_genome(40, activation=name)
+            self.assertTrue(all(n.activation == name for n in g.nodes))
+            for _ in range(5):
+                vals = [random.uniform(-2, 2) for _ in range(7)]
+                self.assertEqual(g.compile().eval(vals), g.eval(vals))
+
+            loaded = Genome.from_bytes(g.to_bytes())
+            self.assertEqual(loaded.activation, name)
+            self.assertEqual([n.activation for n in loaded.nodes], [n.activation for n in g.nodes])
+
+    def test_reads_version_1(self):
+        random.seed(17)
+        g = random_genome(20, node_mut_rate=0.05, con_mut_rate=0.15)
+        data = g.to_bytes()
+        # Strip the activation bytes to get the version 1 encoding
+        num_nodes = len(g.nodes)
+        start = GENOME_HEADER.size
+        v1 = GENOME_MAGIC_V1 + data[4:start] + data[start + 1:start + 1 + num_nodes] + data[start + 1 + 2 * num_nodes:]
+        loaded = Genome.from_bytes(v1)
+        self.assertEqual(loaded.to_bytes(), data)
+
+    def test_unknown_activation(self):
+        with self.assertRaises(ValueError):
+            Genome(7, 2, activation='softplus')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+
+from math2d import Vec2d
+from physics import VectorPhysics
+
+
+def _simulate_shard(task):
+    """
+    Worker side: rebuilds the level and the ships of one shard, simulates
+    them headlessly until every ship is gone and returns their fitness in
+    the order they were given, along with the number of ticks simulated.
+    """
+    import main
+    import neat
+
+    floor, index_landing, area, dt, pruning, ships = task
+    level = main.Level([Vec2d(p) for p in floor])
+    level.index_landing = index_landing
+    area = Vec2d(area)
+
+    game = main.Game(level, [], area, physics=VectorPhysics(), pruning=pruning)
+    for genome, pos, max_fuel in ships:
+        game.ships.append(main.AiShip(Vec2d(pos), max_fuel, genome=neat.Genome.from_bytes(genome), with_fire=False))
+    shard = list(game.ships)
+    game.reset_physics()
+
+    ticks = main.simulate_generation(game, dt)
+
+    fitness = []
+    for s in shard:
+        s.calculate_fitness(level, area.x)
+        fitness.append(s.fitness)
+    return fitness, ticks
+
+
+class ParallelEvaluator:
+    """
+    Evaluates a generation on a pool of worker processes.
+
+    The ships of the generation are split into one shard per worker and
+    every worker simulates its shard to completion on a copy of the level.
+    Ships only interact with the level, so the result is the same as
+    simulating the whole generation at once. The exception is the fitness
+    bound rule of a pruning.Pruning, which only sees the ships of its own
+    shard and so retires fewer ships.
+    """
+
+    def __init__(self, workers=None, *, dt=0.033, pruning=None):
+        self.workers = workers or os.cpu_count()
+        self.dt = dt
+        self.pruning = pruning
+        self.pool = multiprocessing.Pool(self.workers)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def evaluate(self, game, ships):
+        """
+        Simulates the ships on game.level and sets their fitness. Returns the
+        largest number of ticks any shard needed.
+        """
+        if len(ships) == 0:
+            return 0
+
+        floor = [p.as_tup() for p in game.level.floor]
+        area = game.area.as_tup()
+        shard_size = -(-len(ships) // self.workers)
+        shards = [ships[i:i + shard_size] for i in range(0, len(ships), shard_size)]
+        tasks = []
+        for shard in shards:
+            specs = [(s.genome.to_bytes(), s.start_pos.as_tup(), s.maxFuel) for s in shard]
+            tasks.append((floor, game.level.index_landing, area, self.dt, self.pruning, specs))
+
+        ticks = 0
+        for shard, (fitness, shard_ticks) in zip(shards, self.pool.map(_simulate_shard, tasks)):
+            for s, f in zip(shard, fitness):
+                s.fitness = f
+            ticks = max(ticks, shard_ticks)
+        return ticks
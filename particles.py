@@ -0,0 +1,159 @@
+import math
+import random
+
+import numpy as np
+import pygame
+
+MAX_LIFE = 50
+
+
+class ParticlePool:
+    """
+    Fixed size pool of exhaust particles shared by all ships.
+
+    Position, direction and remaining life of every particle live in
+    preallocated arrays used as a ring buffer: new particles overwrite the
+    oldest slots, so there are never more than capacity of them and nothing
+    is allocated per particle. All particles move in one vectorized step and
+    are drawn with a single Surface.blits call from sprites prerendered per
+    life value.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2))
+        self.direction = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity, dtype=int)
+        self.head = 0
+        self.sprites = None
+
+    def __len__(self):
+        return int(np.count_nonzero(self.life > 0))
+
+    def clear(self):
+        self.life[:] = 0
+
+    def emit(self, x, y, dx, dy, life):
+        """
+        Adds particles starting at (x, y). dx, dy and life hold one entry per
+        particle.
+        """
+        n = len(life)
+        if n == 0:
+            return
+        slots = np.arange(self.head, self.head + n) % self.capacity
+        self.head = (self.head + n) % self.capacity
+        self.pos[slots, 0] = x
+        self.pos[slots, 1] = y
+        self.direction[slots, 0] = dx
+        self.direction[slots, 1] = dy
+        self.life[slots] = life
+
+    def step(self):
+        live = self.life > 0
+        self.pos[live] += self.direction[live]
+        self.life[live] -= 1
+
+    def get_sprites(self):
+        if self.sprites is None:
+            self.sprites = []
+            for life in range(MAX_LIFE + 1):
+                sprite = pygame.Surface((5, 5))
+                sprite.set_colorkey((0, 0, 0))
+                pygame.draw.circle(sprite, (200 + life, 50 + 4 * life, life * 5), (2, 2), 2, 1)
+                self.sprites.append(sprite)
+        return self.sprites
+
+    def draw(self, screen):
+        live = np.flatnonzero(self.life > 0)
+        if len(live) == 0:
+            return
+        sprites = self.get_sprites()
+        corners = (self.pos[live] - 2).astype(int).tolist()
+        lives = np.minimum(self.life[live], MAX_LIFE).tolist()
+        screen.blits([(sprites[l], c) for l, c in zip(lives, corners)], False)
+
+# Shared by every Fire unless one is given another pool
+default_pool = ParticlePool()
+
+
+class Fire:
+    """
+    Exhaust of a single ship, emitting into a ParticlePool
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else default_pool
+
+    def update(self, thrust, thrustPos, thrustAng):
+        if thrust <= 0:
+            return
+        b = math.radians(90 - thrustAng)
+        x = thrustPos.x - 25 * math.sin(b)
+        y = thrustPos.y + 25 * math.cos(b)
+        angles = np.empty(thrust)
+        life = np.empty(thrust, dtype=int)
+        for i in range(thrust):
+            angles[i] = math.radians(-thrustAng + random.randint(0, 10))
+            life[i] = random.randint(20, MAX_LIFE)
+        self.pool.emit(x, y, -thrust / 2 * np.cos(angles), -thrust / 2 * np.sin(angles), life)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import unittest
+
+class ParticlePoolTest(unittest.TestCase):
+    def test_ring_buffer(self):
+        pool = ParticlePool(8)
+        pool.emit(0, 0, [1] * 5, [2] * 5, [3] * 5)
+        self.assertEqual(len(pool), 5)
+        pool.emit(10, 10, [0] * 5, [0] * 5, [10] * 5)
+        # The oldest two particles were overwritten
+        self.assertEqual(len(pool), 8)
+        self.assertEqual(pool.life.tolist(), [10, 10, 3, 3, 3, 10, 10, 10])
+
+        for _ in range(3):
+            pool.step()
+        self.assertEqual(len(pool), 5)
+        np.testing.assert_array_equal(pool.pos[2], [3, 6])
+
+        pool.clear()
+        self.assertEqual(len(pool), 0)
+
+    def test_matches_vec2d_spawn(self):
+        from math2d import Vec2d
+        pool = ParticlePool(16)
+        fire = Fire(pool)
+        thrust_pos = Vec2d(100, 200)
+        random.seed(12)
+        fire.update(3, thrust_pos, 70)
+
+        random.seed(12)
+        for i in range(3):
+            direction = Vec2d(-3 / 2, 0)
+            direction.rotate(-70 + random.randint(0, 10))
+            pos = thrust_pos + Vec2d(0, 25).rotated(90 - 70)
+            np.testing.assert_allclose(pool.pos[i], pos.as_tup())
+            np.testing.assert_allclose(pool.direction[i], direction.as_tup())
+            self.assertEqual(pool.life[i], random.randint(20, MAX_LIFE))
+
+    def test_draw_matches_circles(self):
+        pool = ParticlePool(16)
+        pool.emit(20.7, 20.2, [0, 0], [0, 0], [MAX_LIFE, 1])
+        pool.emit(9, 30, [0], [0], [25])
+        screen = pygame.Surface((40, 40))
+        pool.draw(screen)
+
+        expected = pygame.Surface((40, 40))
+        for (x, y), life in [((20, 20), MAX_LIFE), ((20, 20), 1), ((9, 30), 25)]:
+            pygame.draw.circle(expected, (200 + life, 50 + 4 * life, life * 5), (x, y), 2, 1)
+        for x in range(40):
+            for y in range(40):
+                self.assertEqual(screen.get_at((x, y)), expected.get_at((x, y)))
+
+
+if __name__ == '__main__':
+    unittest.main()
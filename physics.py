@@ -0,0 +1,112 @@
+import numpy as np
+
+THRUST_FORCE = 20
+GRAVITY = 3 * 20 # gravity is a bit weak
+
+
+class VectorPhysics:
+    """
+    Structure-of-arrays physics backend for a population of ships.
+
+    Position, velocity, angle, thrust and fuel of every ship loaded into the
+    backend live in NumPy arrays and are integrated in one vectorized step.
+    The Ship objects stay around as views for drawing, collisions and
+    debugging: controls (angle and thrust) are read from them before the
+    step and the integrated state is written back into them after it.
+    """
+
+    def __init__(self, ships=()):
+        self.load(ships)
+
+    def load(self, ships):
+        """
+        Copies the state of the ships into the arrays. Must be called every
+        time a new set of ships is spawned.
+        """
+        ships = list(ships)
+        n = len(ships)
+        self.pos = np.array([s.pos.as_tup() for s in ships], dtype=float).reshape(n, 2)
+        self.vel = np.array([s.vel.as_tup() for s in ships], dtype=float).reshape(n, 2)
+        self.angle = np.array([s.angle.rad for s in ships], dtype=float)
+        self.thrust = np.array([s.thrust for s in ships], dtype=int)
+        self.fuel = np.array([s.fuel for s in ships], dtype=float)
+        for i, s in enumerate(ships):
+            s.physics_index = i
+
+    def __len__(self):
+        return len(self.fuel)
+
+    def step(self, dt, rows):
+        """
+        Integrates the ships at the given rows by dt
+        """
+        thrust = np.where(self.fuel[rows] <= 0, 0, self.thrust[rows])
+        self.thrust[rows] = thrust
+
+        angle = self.angle[rows]
+        force = np.empty((len(rows), 2))
+        force[:, 0] = np.cos(angle) * thrust * THRUST_FORCE
+        force[:, 1] = GRAVITY - np.sin(angle) * thrust * THRUST_FORCE
+
+        self.pos[rows] += self.vel[rows] * dt
+        self.vel[rows] += force * dt # we asume that mass == 1
+        self.fuel[rows] -= thrust * dt
+
+    def update(self, ships, dt):
+        """
+        Same as calling update on every ship, but integrates them all at once
+        """
+        if len(ships) == 0:
+            return
+        rows = np.array([s.physics_index for s in ships], dtype=np.intp)
+        self.angle[rows] = [s.angle.rad for s in ships]
+        self.thrust[rows] = [s.thrust for s in ships]
+
+        self.step(dt, rows)
+
+        state = zip(ships, self.pos[rows].tolist(), self.vel[rows].tolist(), self.fuel[rows].tolist(), self.thrust[rows].tolist())
+        for s, (x, y), (vx, vy), fuel, thrust in state:
+            s.pos.x, s.pos.y = x, y
+            s.vel.x, s.vel.y = vx, vy
+            s.fuel = fuel
+            s.thrust = thrust
+            s.post_update(dt)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import random
+import unittest
+
+class VectorPhysicsTest(unittest.TestCase):
+    def test_matches_ship_update(self):
+        from main import AiShip
+        from math2d import Vec2d
+
+        random.seed(3)
+        scalar = [AiShip(Vec2d(640, 360), 50, with_fire=False) for _ in range(20)]
+        vector = [AiShip(Vec2d(640, 360), 50, with_fire=False) for _ in range(20)]
+        physics = VectorPhysics(vector)
+
+        dt = 0.033
+        for _ in range(200):
+            for a, b in zip(scalar, vector):
+                a.angle.deg = b.angle.deg = random.uniform(0, 180)
+                a.thrust = b.thrust = random.randint(0, 4)
+                a.update(dt)
+            physics.update(vector, dt)
+
+        for a, b in zip(scalar, vector):
+            self.assertAlmostEqual(a.pos.x, b.pos.x, places=6)
+            self.assertAlmostEqual(a.pos.y, b.pos.y, places=6)
+            self.assertAlmostEqual(a.vel.x, b.vel.x, places=6)
+            self.assertAlmostEqual(a.vel.y, b.vel.y, places=6)
+            self.assertAlmostEqual(a.fuel, b.fuel, places=6)
+            self.assertEqual(a.thrust, b.thrust)
+            self.assertAlmostEqual(a.time_alive, b.time_alive, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
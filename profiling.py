@@ -0,0 +1,174 @@
+import gc
+import json
+import sys
+import time
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ['totals', 'start']
+
+    def __init__(self, totals):
+        self.totals = totals
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.totals[0] += time.perf_counter() - self.start
+        self.totals[1] += 1
+        return False
+
+
+class Profiler:
+    """
+    Cumulative time and call count per named phase of the main loop, plus
+    free form counters and allocation statistics per tick.
+
+    Phases are timed with `with profiler.phase('physics'):`. While the
+    profiler is disabled, phase returns a shared no-op context manager and
+    tick and count return right away, so the hooks can stay in the loop.
+
+    Allocations are tracked as the net change of sys.getallocatedblocks()
+    and the number of generation 0 garbage collections between ticks.
+    With a log_file, a JSON line with the totals so far is written every
+    log_every ticks.
+    """
+
+    def __init__(self, *, enabled=True, log_file=None, log_every=1000):
+        self.enabled = enabled
+        self.log_file = log_file
+        self.log_every = log_every
+        self.reset()
+
+    def reset(self):
+        # name -> [seconds, calls]
+        self.totals = {}
+        self.phases = {}
+        self.counters = {}
+        self.ticks = 0
+        self.net_blocks = 0
+        self.gc_collections = 0
+        self.started = time.perf_counter()
+        self.last_blocks = None
+        self.last_collections = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        # Allocation deltas across a disabled stretch would be meaningless
+        self.last_blocks = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _Phase(self.totals.setdefault(name, [0.0, 0]))
+        return phase
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def tick(self):
+        if not self.enabled:
+            return
+        blocks = sys.getallocatedblocks()
+        collections = gc.get_stats()[0]['collections']
+        if self.last_blocks is not None:
+            self.ticks += 1
+            self.net_blocks += blocks - self.last_blocks
+            self.gc_collections += collections - self.last_collections
+            if self.log_file is not None and self.log_every > 0 and self.ticks % self.log_every == 0:
+                self.log_file.write(json.dumps(self.snapshot()) + '\n')
+                self.log_file.flush()
+        self.last_blocks = blocks
+        self.last_collections = collections
+
+    def snapshot(self):
+        """
+        The totals so far as a JSON serializable dict
+        """
+        return {
+            'time': time.perf_counter() - self.started,
+            'ticks': self.ticks,
+            'phases': {name: {'seconds': s, 'calls': c} for name, (s, c) in self.totals.items()},
+            'counters': dict(self.counters),
+            'net_blocks_per_tick': self.net_blocks / self.ticks if self.ticks > 0 else 0.0,
+            'gc_gen0_per_tick': self.gc_collections / self.ticks if self.ticks > 0 else 0.0,
+        }
+
+    def summary(self):
+        """
+        Human readable lines for the HUD
+        """
+        lines = []
+        for name, (seconds, calls) in self.totals.items():
+            per_call = seconds / calls * 1000 if calls > 0 else 0.0
+            lines.append('{}: {:.1f}s, {} calls, {:.2f} ms/call'.format(name, seconds, calls, per_call))
+        for name, value in self.counters.items():
+            lines.append('{}: {}'.format(name, value))
+        if self.ticks > 0:
+            lines.append('blocks/tick: {:+.1f}, gc0/tick: {:.3f}'.format(self.net_blocks / self.ticks, self.gc_collections / self.ticks))
+        return lines
+
+# Shared by everything that is not given a profiler of its own
+disabled = Profiler(enabled=False)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import io
+import unittest
+
+class ProfilerTest(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        profiler = Profiler(enabled=False)
+        with profiler.phase('physics'):
+            pass
+        profiler.count('spawned', 5)
+        profiler.tick()
+        self.assertEqual(profiler.totals, {})
+        self.assertEqual(profiler.counters, {})
+        self.assertEqual(profiler.ticks, 0)
+
+    def test_phases_and_log(self):
+        log = io.StringIO()
+        profiler = Profiler(log_file=log, log_every=2)
+        for _ in range(5):
+            with profiler.phase('physics'):
+                time.sleep(0.001)
+            with profiler.phase('ai'):
+                pass
+            profiler.count('ships', 3)
+            profiler.tick()
+
+        self.assertEqual(profiler.totals['physics'][1], 5)
+        self.assertGreater(profiler.totals['physics'][0], 0.004)
+        self.assertEqual(profiler.counters['ships'], 15)
+        # The first tick only starts the allocation tracking
+        self.assertEqual(profiler.ticks, 4)
+
+        lines = log.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        last = json.loads(lines[-1])
+        self.assertEqual(last['ticks'], 4)
+        self.assertEqual(last['phases']['ai']['calls'], 5)
+        self.assertEqual(len(profiler.summary()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
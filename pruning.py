@@ -0,0 +1,151 @@
+import heapq
+
+
+class Pruning:
+    """
+    Retires ships that can no longer matter before they crash or leave the
+    area, so a generation does not wait on them.
+
+    The rules are:
+      * max_time: the ship has been flying for max_time seconds
+      * no_fuel_ascending: the ship is out of fuel and still moving up
+      * fitness_bound: the best fitness the ship could still reach is below
+        the fitness of the keep-th best ship that already finished. With
+        keep = 4 this never changes which ships spawn_and_reset breeds
+        from, but it does lower the fitness of the retired ships, which
+        matters when breeding with neat.Speciation.
+
+    Retired ships are marked dead, get their fitness computed right away and
+    move to game.dead like crashed ones.
+    """
+
+    def __init__(self, *, max_time=None, no_fuel_ascending=True, fitness_bound=True, keep=4):
+        self.max_time = max_time
+        self.no_fuel_ascending = no_fuel_ascending
+        self.fitness_bound = fitness_bound
+        self.keep = keep
+        self.reset()
+
+    def reset(self):
+        # Best keep fitness values of the finished ships, as a min heap
+        self.top = []
+        self.dead = None
+        self.counted = 0
+
+    def cutoff(self, game):
+        """
+        Returns the fitness a ship must beat to make the top keep, or None
+        if fewer than keep ships have finished
+        """
+        # spawn_and_reset replaces game.dead with a new list every generation
+        if game.dead is not self.dead:
+            self.reset()
+            self.dead = game.dead
+        for s in game.dead[self.counted:]:
+            s.calculate_fitness(game.level, game.area.x)
+            if len(self.top) < self.keep:
+                heapq.heappush(self.top, s.fitness)
+            elif s.fitness > self.top[0]:
+                heapq.heapreplace(self.top, s.fitness)
+        self.counted = len(game.dead)
+        if len(self.top) < self.keep:
+            return None
+        return self.top[0]
+
+    def is_hopeless(self, ship, cutoff):
+        if self.max_time is not None and ship.time_alive >= self.max_time:
+            return True
+        if self.no_fuel_ascending and ship.fuel <= 0 and ship.vel.y < 0:
+            return True
+        if cutoff is not None and ship.fitness_upper_bound() < cutoff:
+            return True
+        return False
+
+    def prune(self, game):
+        """
+        Moves the hopeless ships of the game to game.dead. Returns how many
+        were retired.
+        """
+        if len(game.ships) == 0:
+            return 0
+        cutoff = self.cutoff(game) if self.fitness_bound else None
+
+        alive = []
+        retired = 0
+        for s in game.ships:
+            if s.landed or not self.is_hopeless(s, cutoff):
+                alive.append(s)
+                continue
+            s.dead = True
+            s.calculate_fitness(game.level, game.area.x)
+            game.dead.append(s)
+            retired += 1
+        game.ships = alive
+        return retired
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+
+import random
+import unittest
+
+class PruningTest(unittest.TestCase):
+    def make_game(self, seed, count, pruning):
+        import neat
+        from main import Game, Level, AiShip
+        from math2d import Vec2d
+        from physics import VectorPhysics
+
+        random.seed(seed)
+        area = Vec2d(1280, 720)
+        level = Level.generate(1280, 480, 720, 10)
+        game = Game(level, [], area, physics=VectorPhysics(), pruning=pruning)
+        for _ in range(count):
+            genome = neat.random_genome(random.randint(0, 30), node_mut_rate=0.1, con_mut_rate=0.2)
+            game.ships.append(AiShip(area / 2, 50, genome=genome, with_fire=False))
+        game.reset_physics()
+        return game
+
+    def test_max_time(self):
+        from main import simulate_generation
+        game = self.make_game(21, 30, Pruning(max_time=1, no_fuel_ascending=False, fitness_bound=False))
+        ticks = simulate_generation(game, 0.033)
+        self.assertLessEqual(ticks, 31)
+        self.assertTrue(all(s.time_alive < 1 + 0.033 for s in game.dead))
+
+    def test_no_fuel_ascending(self):
+        from main import AiShip
+        from math2d import Vec2d
+        pruning = Pruning(no_fuel_ascending=True, fitness_bound=False)
+        game = self.make_game(22, 0, pruning)
+        rising = AiShip(Vec2d(640, 100), 50, with_fire=False)
+        rising.fuel = 0
+        rising.vel = Vec2d(0, -5)
+        falling = AiShip(Vec2d(640, 100), 50, with_fire=False)
+        falling.fuel = 0
+        falling.vel = Vec2d(0, 5)
+        game.ships = [rising, falling]
+        self.assertEqual(pruning.prune(game), 1)
+        self.assertEqual(game.ships, [falling])
+        self.assertEqual(game.dead, [rising])
+        self.assertTrue(rising.dead)
+
+    def test_bound_keeps_top_ships(self):
+        from main import simulate_generation
+        dt = 0.033
+        full = self.make_game(23, 50, None)
+        simulate_generation(full, dt)
+        pruned = self.make_game(23, 50, Pruning(fitness_bound=True, no_fuel_ascending=False))
+        simulate_generation(pruned, dt)
+
+        def top(game):
+            for s in game.dead:
+                s.calculate_fitness(game.level, game.area.x)
+            return [s.fitness for s in sorted(game.dead, key=lambda s: s.fitness, reverse=True)[:4]]
+        self.assertEqual(top(full), top(pruned))
+
+
+if __name__ == '__main__':
+    unittest.main()